@@ -6,3 +6,4 @@ class CommoditiesConfig(AppConfig):
 
     def ready(self):
         from apps.commodities import signals
+        from django_freight import database
@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from apps.commodities.models import Inventory, InventoryHistory
+
+import atexit
+import functools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SyncAuditSink:
+    """
+    Writes history rows straight away, inside the caller's transaction.
+    """
+
+    def emit(self, logs):
+        InventoryHistory.objects.bulk_create(logs)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class BufferedAuditSink:
+    """
+    In-memory queue for history rows.
+
+    Rows are queued in-process once the surrounding transaction commits, and
+    written with bulk_create in batches of `flush_size` by a background
+    thread: as soon as that many are pending, and every `flush_interval`
+    seconds otherwise. Without a `flush_interval` there is no thread, and the
+    caller that fills a batch writes it. A failed batch is put back at the
+    head of the queue, and whatever is pending is flushed when the sink is
+    closed or the process exits.
+
+    Delivery is at-most-once: rows still queued when the process dies are
+    lost. Use SyncAuditSink where every event must be kept.
+    """
+
+    def __init__(self, flush_size=100, flush_interval=1.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.worker = None
+
+        atexit.register(self.close)
+
+    def emit(self, logs):
+        logs = list(logs)
+        transaction.on_commit(lambda: self.enqueue(logs))
+
+    def enqueue(self, logs):
+        with self.lock:
+            self.pending.extend(logs)
+            full = len(self.pending) >= self.flush_size
+
+        self.start()
+        if not full:
+            return
+        elif self.worker is not None:
+            self.wakeup.set()
+            return
+
+        try:
+            self.flush()
+        except Exception:
+            # The batch is still pending; the next flush or close() retries it.
+            logger.exception('Failed to flush inventory history rows')
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+
+            for i in range(0, len(batch), self.flush_size):
+                try:
+                    self.write(batch[i:i + self.flush_size])
+                except Exception:
+                    with self.lock:
+                        self.pending[:0] = batch[i:]
+                    raise
+
+    def write(self, logs):
+        # Events are written after the fact, so the inventory they point to
+        # may have been deleted in the meantime; keep the row, drop the link.
+        inventory_ids = {log.inventory_id for log in logs if log.inventory_id is not None}
+        existing = set(Inventory.objects.filter(pk__in=inventory_ids).values_list('pk', flat=True))
+        for log in logs:
+            if log.inventory_id not in existing:
+                log.inventory_id = None
+
+        with transaction.atomic():
+            InventoryHistory.objects.bulk_create(logs)
+
+    def start(self):
+        if self.worker is not None or not self.flush_interval:
+            return
+
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='audit-sink', daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush %d inventory history rows', len(self.pending))
+            finally:
+                connection.close()
+
+    def close(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Lost %d inventory history rows on shutdown', len(self.pending))
+
+
+@functools.lru_cache(maxsize=None)
+def get_sink():
+    config = getattr(settings, 'INVENTORY_AUDIT', {})
+    sink_class = import_string(config.get('SINK', 'apps.commodities.audit.SyncAuditSink'))
+    return sink_class(**config.get('OPTIONS', {}))
+
+@receiver(setting_changed)
+def reset_sink(sender, setting, **kwargs):
+    if setting == 'INVENTORY_AUDIT':
+        # Write out what the previous sink still holds before replacing it.
+        if get_sink.cache_info().currsize:
+            get_sink().close()
+        get_sink.cache_clear()
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+import functools
+import hashlib
+import json
+import time
+
+CACHED_HEADERS = ['Link']
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+def get_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+def get_generation(namespace):
+    # A namespace generation is an opaque token rather than a counter, so an
+    # evicted generation key can never resurrect entries of an older one.
+    cache = get_cache()
+    key = 'response:{}:generation'.format(namespace)
+
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+def invalidate(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        cache.set('response:{}:generation'.format(namespace), time.time_ns(), None)
+
+def make_key(namespace, request):
+    query = sorted(request.query_params.lists())
+    digest = hashlib.md5('{}?{}'.format(request.path, query).encode('utf-8')).hexdigest()
+    return 'response:{}:{}:{}'.format(namespace, get_generation(namespace), digest)
+
+def make_etag(data, headers):
+    content = json.dumps([data, headers], cls=encoders.JSONEncoder, sort_keys=True)
+    return quote_etag(hashlib.md5(content.encode('utf-8')).hexdigest())
+
+def cache_response(namespace):
+    """
+    Cache the serialized data of a successful GET handler under `namespace`,
+    keyed by path and query parameters. Entries carry an ETag, and a matching
+    If-None-Match is answered with 304 before anything is serialized.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_cache()
+            key = make_key(namespace, request)
+
+            entry = cache.get(key)
+            if entry is None:
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+                headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+                entry = {
+                    'data': response.data,
+                    'headers': headers,
+                    'etag': make_etag(response.data, headers),
+                }
+                cache.set(key, entry, get_timeout())
+
+            etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if '*' in etags or entry['etag'] in etags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+
+            headers = dict(entry['headers'], ETag=entry['etag'])
+            return Response(entry['data'], headers=headers)
+        return wrapper
+    return decorator
+
+def invalidates_cache(*namespaces):
+    """
+    Drop every cached response of `namespaces` once the wrapped handler has
+    run successfully.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            response = handler(view, request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                invalidate(*namespaces)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,95 @@
+from rest_framework import exceptions
+
+from apps.commodities.serializers import ValuesSerializerMixin
+
+
+class SparseFieldset:
+    """
+    Field selection for list responses.
+
+    `?fields=a,b` keeps only the named serializer fields and `?omit=c` drops
+    some; the columns loaded from the database are trimmed to match with
+    only(). `?compact=1` replaces the list of objects with
+    `{"fields": [...], "rows": [[...], ...]}`, which spares the repeated keys.
+
+    Serializers with a `ValuesSerializerMixin` fast path are fed `.values()`
+    rows instead of model instances.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    compact_query_param = 'compact'
+
+    def __init__(self, request, serializer_class):
+        self.serializer_class = serializer_class
+        self.fields = serializer_class().fields
+
+        available = list(self.fields)
+        fields = self.get_list_param(request, self.fields_query_param)
+        omit = self.get_list_param(request, self.omit_query_param)
+
+        unknown = [name for name in fields + omit if name not in self.fields]
+        if unknown:
+            raise exceptions.ValidationError({
+                self.fields_query_param: ['Unknown field: {}'.format(name) for name in unknown]
+            })
+
+        self.names = [name for name in available if (not fields or name in fields) and name not in omit]
+        if not self.names:
+            raise exceptions.ValidationError({self.fields_query_param: ['No field is left to return']})
+
+        self.trimmed = len(self.names) < len(available)
+        self.fast = issubclass(serializer_class, ValuesSerializerMixin)
+        self.compact = request.query_params.get(self.compact_query_param, '').lower() in ('1', 'true')
+
+    def get_list_param(self, request, name):
+        values = request.query_params.get(name, '')
+        return [value.strip() for value in values.split(',') if value.strip()]
+
+    def trim_queryset(self, queryset):
+        # values() querysets already select their own columns.
+        if queryset.query.values_select:
+            return queryset
+
+        if self.fast:
+            # Ordering columns and the primary key are read back by keyset
+            # pagination.
+            columns = self.serializer_class.get_value_sources(self.names)
+            columns.append(queryset.model._meta.pk.name)
+            columns.extend(self.get_ordering_columns(queryset))
+            return queryset.values(*dict.fromkeys(columns))
+
+        if not self.trimmed:
+            return queryset
+
+        columns = []
+        for name in self.names:
+            source = self.fields[name].source
+            if source == '*':
+                return queryset
+            columns.append(source.replace('.', '__'))
+        columns.extend(self.get_ordering_columns(queryset))
+
+        if not any('__' in column for column in columns):
+            queryset = queryset.select_related(None)
+        return queryset.only(*columns)
+
+    def get_ordering_columns(self, queryset):
+        return [field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str)]
+
+    def serialize(self, instance):
+        if self.fast:
+            rows = self.serializer_class.represent_values(instance, self.names, self.compact)
+            return {'fields': self.names, 'rows': rows} if self.compact else rows
+
+        serializer = self.serializer_class(instance, many=True)
+        for name in list(serializer.child.fields):
+            if name not in self.names:
+                serializer.child.fields.pop(name)
+
+        if not self.compact:
+            return serializer.data
+
+        return {
+            'fields': self.names,
+            'rows': [[item[name] for name in self.names] for item in serializer.data],
+        }
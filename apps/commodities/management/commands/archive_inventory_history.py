@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.commodities.models import InventoryHistory, InventoryHistoryArchive
+
+import datetime
+
+
+class Command(BaseCommand):
+    help = 'run "manage.py archive_inventory_history --older-than=90" will move history rows older than 90 days ' \
+           'to the archive table in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, help='age in days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='only count the rows that would be moved')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError('Non-positive older-than Value')
+        if options['batch_size'] < 1:
+            raise CommandError('Non-positive batch-size Value')
+
+        cutoff = timezone.now() - datetime.timedelta(days=options['older_than'])
+        if options['dry_run']:
+            count = InventoryHistory.objects.created_until(cutoff).count()
+            self.stdout.write('Would archive {} history rows older than {}'.format(count, cutoff.isoformat()))
+            return
+
+        total = 0
+        while True:
+            moved = self.archive_batch(cutoff, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write('Archived {} history rows'.format(total))
+
+        self.stdout.write('Archived {} history rows older than {}'.format(total, cutoff.isoformat()))
+
+    @transaction.atomic
+    def archive_batch(self, cutoff, batch_size):
+        # Oldest first, so that an interrupted run still leaves every
+        # archived row older than every hot one.
+        ids = list(InventoryHistory.objects.created_until(cutoff)
+                   .order_by('created_at', 'id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+
+        fields = [field.attname for field in InventoryHistory._meta.concrete_fields]
+        rows = InventoryHistory.objects.filter(id__in=ids).values(*fields)
+        InventoryHistoryArchive.objects.bulk_create([InventoryHistoryArchive(**row) for row in rows])
+        InventoryHistory.objects.filter(id__in=ids).delete()
+        return len(ids)
@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.commodities.models import Commodity, InventoryHistory, InventoryHistoryArchive, InventoryMovementRollup
+
+import collections
+import heapq
+import operator
+
+
+class Command(BaseCommand):
+    help = 'run "manage.py backfill_rollups" will rebuild the hourly inventory movement rollups from the history, ' \
+           'archived rows included'
+
+    history_models = (InventoryHistoryArchive, InventoryHistory)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('Non-positive batch or chunk size Value')
+
+        # Rows that cannot be replayed: the batch entries of imports, and the
+        # rows of inventories deleted before their id was snapshotted. The
+        # rollups of their commodity and hour, or of the whole hour when the
+        # commodity is unknown too, are kept as they are.
+        skipped = 0
+        skipped_hours = set()
+        skipped_keys = set()
+        for model in self.history_models:
+            for commodity, created_at in model.objects.filter(inventory_number__isnull=True) \
+                    .values_list('commodity', 'created_at').iterator(chunk_size=options['chunk_size']):
+                bucket = InventoryMovementRollup.objects.get_bucket(created_at)
+                if commodity is None:
+                    skipped_hours.add(bucket)
+                else:
+                    skipped_keys.add((commodity, bucket))
+                skipped += 1
+
+        deltas, touched, incomplete = self.replay(options['chunk_size'])
+        skipped_keys |= incomplete.keys()
+        skipped += sum(incomplete.values())
+
+        # Imports run with --history=none leave no rows at all, so their
+        # rollups are only replaced where the same commodity has history in
+        # the same hour.
+        commodities = set(Commodity.objects.values_list('id', flat=True))
+        rebuilt = {(commodity, bucket) for commodity, bucket in touched
+                   if commodity in commodities and bucket not in skipped_hours
+                   and (commodity, bucket) not in skipped_keys}
+
+        with transaction.atomic():
+            stale = [pk for pk, commodity, bucket in InventoryMovementRollup.objects
+                     .values_list('id', 'commodity', 'bucket')
+                     .iterator(chunk_size=options['chunk_size'])
+                     if (commodity, bucket) in rebuilt]
+            for i in range(0, len(stale), options['batch_size']):
+                InventoryMovementRollup.objects.filter(id__in=stale[i:i + options['batch_size']]).delete()
+
+            rollups = InventoryMovementRollup.objects.bulk_create([
+                InventoryMovementRollup(
+                    commodity_id=commodity, trade_partner_id=trade_partner,
+                    bucket=bucket, type=type, quantity=quantity)
+                for (commodity, trade_partner, bucket, type), quantity in deltas.items()
+                if quantity and (commodity, bucket) in rebuilt
+            ], batch_size=options['batch_size'])
+
+        self.stdout.write('Backfilled {} rollups in {} commodity hours, skipped {} unattributed history rows'.format(
+            len(rollups), len(rebuilt), skipped))
+
+    def replay(self, chunk_size):
+        """
+        Replay each inventory's events in order: an ADD moves its quantity
+        in, a MODIFY moves the previous state out and the new one in, and a
+        DELETE moves the last state out. Each event is attributed to the
+        commodity and trade partner snapshotted on it, or to the inventory's
+        current ones for rows written before the snapshot existed.
+
+        Both tiers are read: archived rows keep their ids, so merging them
+        with the hot ones by (inventory, id) restores each chain.
+        """
+        tiers = [
+            model.objects.filter(inventory_number__isnull=False)
+                .order_by('inventory_number', 'id')
+                .values_list('inventory_number', 'id', 'action', 'commodity', 'trade_partner',
+                             'inventory__commodity', 'inventory__trade_partner', 'type', 'quantity', 'created_at')
+                .iterator(chunk_size=chunk_size)
+            for model in self.history_models
+        ]
+        events = heapq.merge(*tiers, key=operator.itemgetter(0, 1))
+
+        deltas = collections.Counter()
+        touched = set()
+        incomplete = collections.Counter()
+        previous = (None, None)
+        for inventory, _, action, commodity, trade_partner, current_commodity, current_trade_partner, \
+                type, quantity, created_at in events:
+            if commodity is None:
+                commodity, trade_partner = current_commodity, current_trade_partner
+            bucket = InventoryMovementRollup.objects.get_bucket(created_at)
+            touched.add((commodity, bucket))
+
+            previous_inventory, previous_key = previous
+            if previous_inventory == inventory and previous_key is not None:
+                previous_commodity, previous_trade_partner, previous_type, previous_quantity = previous_key
+                deltas[previous_commodity, previous_trade_partner, bucket, previous_type] -= previous_quantity
+                touched.add((previous_commodity, bucket))
+            elif action == InventoryHistory.Action.DELETE:
+                deltas[commodity, trade_partner, bucket, type] -= quantity
+            elif action == InventoryHistory.Action.MODIFY:
+                # The ADD was not logged per row (an import with batch or no
+                # history), so what this event moved out is unknown.
+                incomplete[commodity, bucket] += 1
+
+            if action == InventoryHistory.Action.DELETE:
+                previous = (inventory, None)
+            else:
+                deltas[commodity, trade_partner, bucket, type] += quantity
+                previous = (inventory, (commodity, trade_partner, type, quantity))
+
+        return deltas, touched, incomplete
@@ -0,0 +1,241 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from model_bakery import baker
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.commodities import serializers
+from apps.commodities.models import TradePartner, Commodity, Inventory, InventoryHistory, CommodityStockSummary
+from apps.commodities.views import LinkHeaderPagination, CursorLinkHeaderPagination
+
+import contextlib
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+
+
+class Command(BaseCommand):
+    help = 'run "manage.py benchmark --inventories=100000" will seed a throwaway test database and report ' \
+           'p50/p95 latency, queries per request and peak memory of the commodities API hot paths as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inventories', type=int, default=10000)
+        parser.add_argument('--commodities', type=int, default=100)
+        parser.add_argument('--trade-partners', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--serialize-rows', type=int, default=1000)
+        parser.add_argument('--output', default=None, help='write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        for name in ('inventories', 'commodities', 'trade_partners', 'iterations', 'page_size', 'batch_size',
+                     'serialize_rows'):
+            if options[name] < 1:
+                raise CommandError('Non-positive {} Value'.format(name.replace('_', '-')))
+
+        with self.quiet_sql_logging(), self.test_database():
+            started = time.perf_counter()
+            self.seed(options)
+            seed_seconds = time.perf_counter() - started
+
+            results = {}
+            for name, run in self.get_scenarios(options):
+                results[name] = self.measure(run, options['iterations'])
+
+            # The serialization scenarios run on prefetched rows, at most
+            # --serialize-rows of them; report what one row costs.
+            for name in self.serialize_scenarios:
+                results[name]['p50_us_per_row'] = \
+                    round(results[name]['p50_ms'] * 1000 / self.serialized_rows, 3)
+
+        report = {
+            'environment': {
+                'commit': self.get_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'config': {
+                'inventories': options['inventories'],
+                'commodities': options['commodities'],
+                'trade_partners': options['trade_partners'],
+                'iterations': options['iterations'],
+                'page_size': options['page_size'],
+                'serialize_rows': options['serialize_rows'],
+            },
+            'seed_seconds': round(seed_seconds, 3),
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    @contextlib.contextmanager
+    def test_database(self):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    @contextlib.contextmanager
+    def quiet_sql_logging(self):
+        # CaptureQueriesContext turns on the debug cursor, which would log
+        # every statement through settings.LOGGING and skew the timings.
+        logger = logging.getLogger('django.db.backends')
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            yield
+        finally:
+            logger.setLevel(level)
+
+    serialize_scenarios = ['serialize-inventory-list-drf', 'serialize-inventory-list-values']
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+
+        self.user = baker.make_recipe('apps.users.user')
+        TradePartner.objects.bulk_create(
+            baker.prepare_recipe('apps.commodities.trade_partner', _quantity=options['trade_partners']))
+        partners = list(TradePartner.objects.all())
+
+        Commodity.objects.bulk_create([
+            baker.prepare_recipe('apps.commodities.commodity', trade_partner=partners[i % len(partners)])
+            for i in range(options['commodities'])
+        ], batch_size=batch_size)
+        commodities = list(Commodity.objects.all())
+
+        remaining = options['inventories']
+        while remaining > 0:
+            size = min(remaining, batch_size)
+            Inventory.objects.bulk_create([
+                baker.prepare_recipe(
+                    'apps.commodities.inventory',
+                    type=Inventory.Type.SHIPPING if i % 2 else Inventory.Type.RECEIVING,
+                    quantity=i % 1000,
+                    commodity=commodities[i % len(commodities)],
+                    trade_partner=partners[i % len(partners)])
+                for i in range(size)
+            ])
+            remaining -= size
+
+        last = Inventory.objects.order_by('-id').values_list('id', flat=True).first()
+        for start in range(0, last, batch_size):
+            InventoryHistory.objects.bulk_create([
+                InventoryHistory(action=InventoryHistory.Action.ADD, type=inventory_type, quantity=quantity,
+                                 inventory_id=pk, inventory_number=pk, user=self.user)
+                for pk, inventory_type, quantity in Inventory.objects
+                    .filter(id__gt=start, id__lte=start + batch_size)
+                    .values_list('id', 'type', 'quantity')
+            ])
+
+        CommodityStockSummary.objects.rebuild()
+        self.last_inventory_id = last
+
+    def get_scenarios(self, options):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        factory = APIRequestFactory()
+        page_size = options['page_size']
+        deep_offset = max(options['inventories'] - page_size, 0)
+        last_inventory = self.last_inventory_id
+
+        def get(url, params=None):
+            def run():
+                response = client.get(url, params)
+                assert response.status_code == 200, response.status_code
+                return response
+            return run
+
+        def paginate(pagination_class, params):
+            def run():
+                request = factory.get('/api/pages/', params)
+                paginator = pagination_class()
+                data = paginator.paginate_queryset(Inventory.objects.all(), request)
+                return paginator.get_paginated_response([inventory.pk for inventory in data])
+            return run
+
+        serializer_class = serializers.InventoryListSerializer
+        names = list(serializer_class().fields)
+        queryset = Inventory.objects.select_related('commodity')[:options['serialize_rows']]
+        instances = list(queryset)
+        rows = list(queryset.values(*serializer_class.get_value_sources(names)))
+        self.serialized_rows = len(instances)
+
+        return [
+            ('serialize-inventory-list-drf', lambda: serializer_class(instances, many=True).data),
+            ('serialize-inventory-list-values', lambda: serializer_class.represent_values(rows, names)),
+            ('inventory-list', get('/api/inventories/', {'limit': page_size})),
+            ('inventory-list-deep', get('/api/inventories/', {'limit': page_size, 'offset': deep_offset})),
+            ('inventory-summary', get('/api/inventories/summary/', {'limit': page_size})),
+            ('inventory-history', get('/api/inventories/history/', {'page_size': page_size})),
+            ('inventory-history-by-inventory', get('/api/inventories/history/', {'inventory': last_inventory})),
+            ('trade-partner-list', get('/api/trade-partners/', {'page_size': page_size})),
+            ('link-header-pagination-deep', paginate(LinkHeaderPagination, {
+                'page': max(options['inventories'] // page_size, 1), 'page_size': page_size})),
+            ('cursor-link-header-pagination', paginate(CursorLinkHeaderPagination, {'page_size': page_size})),
+        ]
+
+    def measure(self, run, iterations):
+        # Warm up connections, caches and lazy imports before timing.
+        cache.clear()
+        run()
+
+        latencies = []
+        queries = []
+        for _ in range(iterations):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                run()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+
+        # Memory is traced in a separate pass; tracemalloc slows every
+        # allocation down and would distort the latencies above.
+        cache.clear()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'p50_ms': round(self.percentile(latencies, 50), 3),
+            'p95_ms': round(self.percentile(latencies, 95), 3),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'queries_per_request': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def percentile(self, values, percent):
+        index = (len(values) - 1) * percent / 100
+        lower = int(index)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+    def get_commit(self):
+        try:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from prettytable import PrettyTable
+
+from apps.commodities.models import Inventory
+
+import re
+
+# Plan lines that read a whole table, per database vendor. Index-only scans
+# (SQLite's "SCAN ... USING COVERING INDEX") are not full scans; a plain
+# "SCAN ... USING INDEX" walks the whole index and looks up every row, so it
+# is one.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(?P<table>\w+)(?! USING COVERING INDEX)(?:\s|$)'),
+    'postgresql': re.compile(r'\bSeq Scan on (?P<table>\w+)'),
+    'mysql': re.compile(r'^\d+\t\w+\t(?P<table>\w+)\t[^\t]*\tALL\t', re.MULTILINE),
+}
+
+
+class Command(BaseCommand):
+    help = 'run "manage.py explain_inventory_queries" will EXPLAIN every InventoryManager/InventoryQuerySet ' \
+           'query against the configured database and report the ones that read a whole table'
+
+    field_names = ['Query', 'Full scans', 'Scan expected']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='print the plan of every query')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='exit with an error when an unexpected full scan is found, e.g. in CI')
+
+    def get_queries(self):
+        """
+        (name, queryset, whether a full scan is expected). The querysets are
+        the ones the views and commands actually evaluate.
+        """
+        return [
+            ('Inventory.objects.summarize()',
+                Inventory.objects.summarize(), False),
+            ('Inventory.objects.summarize(group_by, trade_partner, min_total)',
+                Inventory.objects.summarize('type', trade_partner=1, min_total=100), False),
+            # Totals for every trade partner read every inventory row; the
+            # trade_partner index only saves the sort.
+            ('Inventory.objects.summarize(group_by=trade_partner)',
+                Inventory.objects.summarize('trade_partner'), True),
+            ('Inventory.objects.list_glutted_commodities(quantity)',
+                Inventory.objects.list_glutted_commodities(100)
+                    .values_list('commodity__id', 'commodity__name', 'total_quantity'), False),
+            ('Inventory.objects.list_glutted_commodities(quantity, commodity_trade_partner)',
+                Inventory.objects.list_glutted_commodities(100, 1)
+                    .values_list('commodity__id', 'commodity__name', 'total_quantity'), False),
+            ('Inventory.objects.filter(commodity=...)',
+                Inventory.objects.filter(commodity=1), False),
+            # Each type is roughly half of the table, which no index helps with.
+            ('Inventory.objects.shipping()',
+                Inventory.objects.shipping(), True),
+            ('Inventory.objects.receiving()',
+                Inventory.objects.receiving(), True),
+        ]
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.stderr.write('Full scans are not detected on {}; showing plans only'.format(connection.vendor))
+
+        table = PrettyTable()
+        table.field_names = self.field_names
+        table.align = 'l'
+
+        unexpected = []
+        for name, queryset, expected in self.get_queries():
+            plan = queryset.explain()
+            scans = sorted({match.group('table') for match in pattern.finditer(plan)}) if pattern else []
+            if scans and not expected:
+                unexpected.append(name)
+
+            table.add_row([name, ', '.join(scans) or '-', 'yes' if expected else 'no'])
+            if options['verbose_plans'] or pattern is None:
+                self.stdout.write('{}\n{}\n'.format(name, plan))
+
+        self.stdout.write(str(table))
+
+        if unexpected and options['fail_on_scan']:
+            raise CommandError('Unexpected full scans: {}'.format('; '.join(unexpected)))
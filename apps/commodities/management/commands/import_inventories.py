@@ -0,0 +1,227 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.commodities import signals
+from apps.commodities.models import TradePartner, Commodity, Inventory, InventoryHistory, \
+    InventoryImportCheckpoint
+
+import collections
+import csv
+import itertools
+import json
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'run "manage.py import_inventories inventories.csv --user=admin" will load inventories from a CSV or ' \
+           'NDJSON file with chunked bulk inserts, keeping the stock summary, rollups and history up to date'
+
+    formats = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file with type, quantity, commodity and trade_partner columns; '
+                                         'commodity and trade_partner are ids, or names when not numeric')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help='defaults to the file extension')
+        parser.add_argument('--user', default=None, help='username the history is recorded for')
+        parser.add_argument('--history', choices=['row', 'batch', 'none'], default='row',
+                            help='one history entry per row (as the API writes), one per type per transaction, '
+                                 'or none')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='rows per INSERT, at most what the database accepts')
+        parser.add_argument('--transaction-size', type=int, default=10000, help='rows per transaction')
+        parser.add_argument('--checkpoint', default=None,
+                            help='name under which the rows committed so far are recorded in the database; '
+                                 'a rerun with the same name resumes after them')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Non-positive batch-size Value')
+        if options['transaction_size'] < 1:
+            raise CommandError('Non-positive transaction-size Value')
+
+        path = options['path']
+        file_format = options['format'] or self.formats.get(os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise CommandError('Cannot tell the format of {}; pass --format'.format(path))
+
+        self.user = self.get_user(options)
+
+        self.commodities = self.build_lookup(Commodity.objects.only('id', 'name'))
+        self.trade_partners = self.build_lookup(TradePartner.objects.only('id', 'name'))
+
+        done = self.read_checkpoint(options['checkpoint'], path)
+        if done:
+            self.stdout.write('Resuming after {} rows'.format(done))
+
+        imported = 0
+        started = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as stream:
+            records = itertools.islice(self.read_records(stream, file_format), done, None)
+            while True:
+                chunk = list(itertools.islice(records, options['transaction_size']))
+                if not chunk:
+                    break
+
+                inventories = [self.build_inventory(line, record) for line, record in chunk]
+                done += len(chunk)
+                self.import_chunk(inventories, path, done, options)
+
+                imported += len(chunk)
+                self.stdout.write('Imported {} rows ({:.0f} rows/s)'.format(
+                    done, imported / (time.perf_counter() - started)))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Imported {} rows from {} in {:.1f}s ({:.0f} rows/s)'.format(
+            imported, path, elapsed, imported / elapsed if elapsed else 0))
+
+    def get_user(self, options):
+        if options['history'] == 'none':
+            return None
+        if not options['user']:
+            raise CommandError('--user is required unless --history=none')
+
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError('Unknown user: {}'.format(options['user']))
+        return user
+
+    def build_lookup(self, queryset):
+        by_id = {obj.pk: obj for obj in queryset}
+        by_name = collections.defaultdict(list)
+        for obj in by_id.values():
+            by_name[obj.name].append(obj)
+        return by_id, by_name
+
+    def read_records(self, stream, file_format):
+        """
+        (line number, dict) for every row of the file.
+        """
+        if file_format == 'csv':
+            reader = csv.DictReader(stream)
+            for record in reader:
+                yield reader.line_num, record
+            return
+
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as exc:
+                raise CommandError('line {}: {}'.format(line, exc))
+            if not isinstance(record, dict):
+                raise CommandError('line {}: expected an object'.format(line))
+            yield line, record
+
+    def build_inventory(self, line, record):
+        try:
+            return Inventory(
+                type=self.parse_type(record.get('type')),
+                quantity=self.parse_quantity(record.get('quantity')),
+                commodity=self.resolve(self.commodities, 'commodity', record.get('commodity'), required=True),
+                trade_partner=self.resolve(self.trade_partners, 'trade partner', record.get('trade_partner')))
+        except ValueError as exc:
+            raise CommandError('line {}: {}'.format(line, exc))
+
+    def parse_type(self, value):
+        if isinstance(value, str) and value.strip().upper() in Inventory.Type.names:
+            return Inventory.Type[value.strip().upper()]
+        try:
+            return Inventory.Type(int(value))
+        except (TypeError, ValueError):
+            raise ValueError('invalid type {!r}'.format(value))
+
+    def parse_quantity(self, value):
+        try:
+            quantity = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('invalid quantity {!r}'.format(value))
+        if quantity < 0:
+            raise ValueError('negative quantity {}'.format(quantity))
+        return quantity
+
+    def resolve(self, lookup, label, value, required=False):
+        by_id, by_name = lookup
+        if isinstance(value, str):
+            value = value.strip()
+
+        if value is None or value == '':
+            if required:
+                raise ValueError('missing {}'.format(label))
+            return None
+        elif not isinstance(value, (int, str)):
+            raise ValueError('invalid {} {!r}'.format(label, value))
+        elif isinstance(value, int) or value.isdigit():
+            obj = by_id.get(int(value))
+            if obj is None:
+                raise ValueError('unknown {} #{}'.format(label, value))
+            return obj
+
+        matches = by_name.get(value, [])
+        if not matches:
+            raise ValueError('unknown {} {!r}'.format(label, value))
+        elif len(matches) > 1:
+            raise ValueError('{} {!r} is ambiguous; use its id'.format(label, value))
+        return matches[0]
+
+    @transaction.atomic
+    def import_chunk(self, inventories, path, done, options):
+        batch_size = self.get_batch_size(Inventory, inventories, options['batch_size'])
+        if options['history'] == 'row':
+            Inventory.objects.bulk_create_with_ids(inventories, batch_size=batch_size)
+        else:
+            Inventory.objects.bulk_create(inventories, batch_size=batch_size)
+        signals.record_stock_change(added=inventories)
+
+        # History is written in this transaction rather than through the
+        # audit sink, so that the checkpoint covers it too and millions of
+        # rows are not queued in memory.
+        if options['history'] == 'row':
+            logs = [signals.make_inventory_save_log(inventory, self.user, True) for inventory in inventories]
+        elif options['history'] == 'batch':
+            logs = self.make_batch_logs(inventories, path)
+        else:
+            logs = []
+        InventoryHistory.objects.bulk_create(
+            logs, batch_size=self.get_batch_size(InventoryHistory, logs, options['batch_size']))
+
+        # Committed with the rows, so a resumed run neither skips nor repeats
+        # any of them.
+        if options['checkpoint'] is not None:
+            InventoryImportCheckpoint.objects.update_or_create(
+                name=options['checkpoint'], defaults={'path': os.path.abspath(path), 'rows': done})
+
+    def get_batch_size(self, model, objs, batch_size):
+        # Django does not cap an explicit batch size at the backend's limit
+        # on query parameters (999 on SQLite).
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        return max(min(batch_size, connection.ops.bulk_batch_size(fields, objs)), 1)
+
+    def make_batch_logs(self, inventories, path):
+        totals = collections.defaultdict(lambda: [0, 0])
+        for inventory in inventories:
+            total = totals[inventory.type]
+            total[0] += 1
+            total[1] += inventory.quantity
+
+        logs = []
+        for type, (count, quantity) in sorted(totals.items()):
+            detail = '{} inventories imported from {} by {} (#{})'.format(
+                count, os.path.basename(path), self.user.username, self.user.id)
+            logs.append(InventoryHistory(action=InventoryHistory.Action.ADD, detail=detail, type=type,
+                                         quantity=quantity, user=self.user))
+        return logs
+
+    def read_checkpoint(self, name, path):
+        if name is None:
+            return 0
+
+        checkpoint = InventoryImportCheckpoint.objects.filter(name=name).first()
+        if checkpoint is None:
+            return 0
+        if checkpoint.path != os.path.abspath(path):
+            raise CommandError('Checkpoint {} belongs to {}'.format(name, checkpoint.path))
+        return checkpoint.rows
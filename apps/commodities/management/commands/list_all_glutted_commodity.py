@@ -2,30 +2,73 @@ from django.core.management.base import BaseCommand, CommandError
 
 from prettytable import PrettyTable
 
-from apps.commodities.models import Inventory
+from apps.commodities.models import Inventory, CommodityStockSummary
+
+import csv
+import json
 
 
 class Command(BaseCommand):
     help = 'run "manage.py list_all_glutted_commodity --quantity=100" will show all commodities whose quantity >= 100'
 
+    field_names = ['id', 'Name', 'Quantity']
+
     def add_arguments(self, parser):
         # Positional arguments
 
         # Named (optional) arguments
         parser.add_argument('--quantity', type=int, default=100)
+        parser.add_argument('--format', choices=['table', 'csv', 'json'], default='table',
+                            help='table buffers every row; csv and json are written row by row')
+        parser.add_argument('--limit', type=int, default=None)
+        parser.add_argument('--commodity-trade-partner', type=int, default=None,
+                            help='only commodities whose own trade partner is this id; the trade partners of '
+                                 'their inventories, which /api/inventories/summary/?trade_partner= filters on, '
+                                 'are not considered')
+        parser.add_argument('--source', choices=['inventory', 'summary'], default='inventory',
+                            help='aggregate the inventory table, or read the precomputed stock summary')
 
     def handle(self, *args, **options):
         quantity = options['quantity']
         if quantity < 0:
             raise CommandError('Negavite quantity Value')
 
-        glutted_commodities = Inventory.objects.list_glutted_commodities(quantity) \
+        limit = options['limit']
+        if limit is not None and limit < 1:
+            raise CommandError('Non-positive limit Value')
+
+        if options['source'] == 'summary':
+            manager = CommodityStockSummary.objects
+        else:
+            manager = Inventory.objects
+
+        glutted_commodities = manager.list_glutted_commodities(quantity, options['commodity_trade_partner']) \
             .values_list('commodity__id', 'commodity__name', 'total_quantity')
+        if limit is not None:
+            glutted_commodities = glutted_commodities[:limit]
 
+        write = getattr(self, 'write_{}'.format(options['format']))
+        write(glutted_commodities)
 
+    def write_table(self, glutted_commodities):
         table = PrettyTable()
-        table.field_names = ['id', 'Name', 'Quantity']
-        for commodity in glutted_commodities:
+        table.field_names = self.field_names
+        for commodity in glutted_commodities.iterator():
             table.add_row(commodity)
 
         self.stdout.write(str(table))
+
+    def write_csv(self, glutted_commodities):
+        writer = csv.writer(self.stdout, lineterminator='')
+        writer.writerow(self.field_names)
+        for commodity in glutted_commodities.iterator():
+            writer.writerow(commodity)
+
+    def write_json(self, glutted_commodities):
+        self.stdout.write('[')
+        separator = ''
+        for commodity in glutted_commodities.iterator():
+            row = dict(zip(self.field_names, commodity))
+            self.stdout.write(separator + json.dumps(row), ending='')
+            separator = ',\n'
+        self.stdout.write('\n]' if separator else ']')
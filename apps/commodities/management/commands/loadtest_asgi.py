@@ -0,0 +1,156 @@
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from rest_framework.authtoken.models import Token
+
+from apps.commodities.management.commands import benchmark
+from django_freight.handlers import ReadPoolASGIHandler
+
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import json
+import queue
+import time
+
+
+class Command(benchmark.Command):
+    help = 'run "manage.py loadtest_asgi --connections=32" will seed a throwaway test database and compare the ' \
+           'read endpoint throughput of the WSGI app (one thread per connection, like a threaded WSGI server) ' \
+           'with the ASGI app, each serving the same requests over the same number of concurrent connections'
+
+    paths = [
+        '/api/inventories/',
+        '/api/inventories/summary/',
+        '/api/inventories/history/',
+        '/api/commodities/',
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inventories', type=int, default=10000)
+        parser.add_argument('--commodities', type=int, default=100)
+        parser.add_argument('--trade-partners', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--connections', type=int, default=32)
+        parser.add_argument('--db-latency-ms', type=float, default=2.0,
+                            help='simulated network round trip added to every query, as with a remote database')
+
+    def handle(self, *args, **options):
+        for name in ('inventories', 'commodities', 'trade_partners', 'batch_size', 'requests', 'connections'):
+            if options[name] < 1:
+                raise CommandError('Non-positive {} Value'.format(name.replace('_', '-')))
+
+        latency = options['db_latency_ms'] / 1000
+
+        def simulate_latency(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def install_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(simulate_latency)
+
+        with self.quiet_sql_logging(), self.test_database():
+            self.seed(options)
+            self.token = Token.objects.create(user=self.user).key
+
+            connection.ensure_connection()
+            connection.execute_wrappers.append(simulate_latency)
+            connection_created.connect(install_latency)
+            try:
+                wsgi = self.run_wsgi(options['requests'], options['connections'])
+                asgi = asyncio.run(self.run_asgi(options['requests'], options['connections']))
+            finally:
+                connection_created.disconnect(install_latency)
+                connection.execute_wrappers.remove(simulate_latency)
+
+        report = {
+            'config': {
+                'inventories': options['inventories'],
+                'requests': options['requests'],
+                'connections': options['connections'],
+                'db_latency_ms': options['db_latency_ms'],
+            },
+            'wsgi': wsgi,
+            'asgi': asgi,
+            'speedup': round(asgi['requests_per_second'] / wsgi['requests_per_second'], 2),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def get_path(self, i):
+        return self.paths[i % len(self.paths)]
+
+    def run_wsgi(self, requests, connections):
+        paths = queue.Queue()
+        for i in range(requests):
+            paths.put_nowait(self.get_path(i))
+
+        def connection_worker():
+            client = Client(HTTP_AUTHORIZATION='Token {}'.format(self.token))
+            try:
+                while True:
+                    try:
+                        path = paths.get_nowait()
+                    except queue.Empty:
+                        return
+                    response = client.get(path)
+                    assert response.status_code == 200, response.status_code
+            finally:
+                connection.close()
+
+        cache.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='wsgi') as executor:
+            for future in [executor.submit(connection_worker) for _ in range(connections)]:
+                future.result()
+        return self.get_result(requests, time.perf_counter() - started)
+
+    async def run_asgi(self, requests, connections):
+        application = ReadPoolASGIHandler()
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(self.get_path(i))
+
+        async def connection_worker():
+            while not queue.empty():
+                status = await self.asgi_get(application, queue.get_nowait())
+                assert status == 200, status
+
+        cache.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*[connection_worker() for _ in range(connections)])
+        elapsed = time.perf_counter() - started
+
+        application.executor.shutdown()
+        return self.get_result(requests, elapsed)
+
+    async def asgi_get(self, application, path):
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', 'Token {}'.format(self.token).encode('ascii')),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        await application(scope, receive, send)
+        return messages[0]['status']
+
+    def get_result(self, requests, elapsed):
+        return {
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(requests / elapsed, 1),
+        }
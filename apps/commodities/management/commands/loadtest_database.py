@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from apps.commodities.management.commands import benchmark
+from apps.commodities.models import Commodity, Inventory
+
+import collections
+import contextlib
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+class Command(benchmark.Command):
+    help = 'run "manage.py loadtest_database --threads=8" will seed a throwaway SQLite file database and compare ' \
+           'the throughput of parallel "POST /api/inventories/" requests under Django\'s default connection ' \
+           'settings with the DATABASES profile from settings'
+
+    # Django's defaults: a new connection per request, rollback journal
+    # synced on every commit and the sqlite3 module's 5 second busy timeout.
+    default_profile = {
+        'CONN_MAX_AGE': 0,
+        'JOURNAL_MODE': 'delete',
+        'SYNCHRONOUS': 'full',
+        'OPTIONS': {'timeout': 5},
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inventories', type=int, default=1000)
+        parser.add_argument('--commodities', type=int, default=100)
+        parser.add_argument('--trade-partners', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        for name in ('inventories', 'commodities', 'trade_partners', 'batch_size', 'requests', 'threads'):
+            if options[name] < 1:
+                raise CommandError('Non-positive {} Value'.format(name.replace('_', '-')))
+        if connection.vendor != 'sqlite':
+            raise CommandError('loadtest_database compares SQLite profiles; {} is configured'.format(connection.vendor))
+
+        settings_dict = settings.DATABASES['default']
+        configured_profile = {key: settings_dict.get(key) for key in self.default_profile}
+
+        # DEBUG is off as in production; the debug toolbar would otherwise
+        # record a stack trace for every query and dwarf the database time.
+        results = {}
+        with self.quiet_sql_logging(), self.quiet_request_logging(), override_settings(DEBUG=False), \
+                tempfile.TemporaryDirectory() as directory:
+            for name, profile in [('default', self.default_profile), ('configured', configured_profile)]:
+                path = os.path.join(directory, '{}.sqlite3'.format(name))
+                with self.database_profile(profile, path), self.test_database():
+                    self.seed(options)
+                    self.token = Token.objects.create(user=self.user).key
+                    self.commodity_ids = list(Commodity.objects.values_list('id', flat=True))
+                    connection.close()
+
+                    result = self.run_writers(options['requests'], options['threads'])
+                    result['inventories_created'] = Inventory.objects.count() - options['inventories']
+                    results[name] = dict(result, profile=profile)
+
+        report = {
+            'config': {
+                'requests': options['requests'],
+                'threads': options['threads'],
+            },
+            'default': results['default'],
+            'configured': results['configured'],
+            'speedup': round(
+                results['configured']['requests_per_second'] / results['default']['requests_per_second'], 2),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @contextlib.contextmanager
+    def quiet_request_logging(self):
+        # Failed requests are counted in the report rather than logged.
+        logger = logging.getLogger('django.request')
+        level = logger.level
+        logger.setLevel(logging.CRITICAL)
+        try:
+            yield
+        finally:
+            logger.setLevel(level)
+
+    @contextlib.contextmanager
+    def database_profile(self, profile, path):
+        # Connections of every thread are built from this same dict.
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict.get(key) for key in profile}
+        saved_test_name = settings_dict['TEST'].get('NAME')
+
+        settings_dict.update(profile)
+        settings_dict['TEST']['NAME'] = path
+        try:
+            yield
+        finally:
+            settings_dict.update(saved)
+            settings_dict['TEST']['NAME'] = saved_test_name
+
+    def run_writers(self, requests, threads):
+        counter = itertools.count()
+        statuses = collections.Counter()
+        lock = threading.Lock()
+
+        def writer():
+            client = Client(HTTP_AUTHORIZATION='Token {}'.format(self.token), raise_request_exception=False)
+            try:
+                for i in iter(lambda: next(counter), None):
+                    if i >= requests:
+                        break
+                    response = client.post('/api/inventories/', data={
+                        'type': Inventory.Type.SHIPPING if i % 2 else Inventory.Type.RECEIVING,
+                        'quantity': i % 1000,
+                        'commodity': self.commodity_ids[i % len(self.commodity_ids)],
+                    }, content_type='application/json')
+                    with lock:
+                        statuses[response.status_code] += 1
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'seconds': round(elapsed, 3),
+            'requests_per_second': round(statuses[201] / elapsed, 1),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        }
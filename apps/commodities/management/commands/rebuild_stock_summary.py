@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.commodities.models import CommodityStockSummary
+
+
+class Command(BaseCommand):
+    help = 'run "manage.py rebuild_stock_summary" will recompute the per-commodity stock summary from all inventories'
+
+    def handle(self, *args, **options):
+        CommodityStockSummary.objects.rebuild()
+
+        count = CommodityStockSummary.objects.count()
+        self.stdout.write('Rebuilt stock summary for {} commodities'.format(count))
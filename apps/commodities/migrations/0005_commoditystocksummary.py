@@ -0,0 +1,53 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:13
+
+from django.db import migrations, models
+from django.db.models import Q, Count, Sum, Value as V
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def build_stock_summary(apps, schema_editor):
+    Inventory = apps.get_model('commodities', 'Inventory')
+    CommodityStockSummary = apps.get_model('commodities', 'CommodityStockSummary')
+
+    summaries = Inventory.objects.values('commodity') \
+        .annotate(inventory_count = Count('id')) \
+        .annotate(total_quantity = Coalesce(Sum('quantity'), V(0))) \
+        .annotate(shipping_quantity = Coalesce(Sum('quantity', filter=Q(type=1)), V(0))) \
+        .annotate(receiving_quantity = Coalesce(Sum('quantity', filter=Q(type=2)), V(0))) \
+        .order_by()
+
+    CommodityStockSummary.objects.bulk_create([
+        CommodityStockSummary(
+            commodity_id=summary['commodity'],
+            inventory_count=summary['inventory_count'],
+            total_quantity=summary['total_quantity'],
+            shipping_quantity=summary['shipping_quantity'],
+            receiving_quantity=summary['receiving_quantity'])
+        for summary in summaries
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0004_auto_20200406_0831'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommodityStockSummary',
+            fields=[
+                ('commodity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='commodities.Commodity')),
+                ('inventory_count', models.IntegerField(default=0)),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('shipping_quantity', models.BigIntegerField(default=0)),
+                ('receiving_quantity', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'commodities_commodity_stock_summary',
+                'ordering': ['commodity'],
+            },
+        ),
+        migrations.RunPython(build_stock_summary, migrations.RunPython.noop),
+    ]
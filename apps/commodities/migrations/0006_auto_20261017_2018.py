@@ -0,0 +1,19 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0005_commoditystocksummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventoryhistory',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
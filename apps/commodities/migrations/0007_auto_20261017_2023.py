@@ -0,0 +1,37 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0006_auto_20261017_2018'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovementRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('type', models.IntegerField(choices=[(1, 'Shipping'), (2, 'Receiving')])),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('commodity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='commodities.Commodity')),
+                ('trade_partner', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='commodities.TradePartner')),
+            ],
+            options={
+                'db_table': 'commodities_inventory_movement_rollup',
+                'ordering': ['bucket', 'commodity', 'trade_partner', 'type'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovementrollup',
+            index=models.Index(fields=['bucket'], name='commodities_bucket_ede1e9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventorymovementrollup',
+            constraint=models.UniqueConstraint(fields=('commodity', 'trade_partner', 'bucket', 'type'), name='unique_movement_rollup'),
+        ),
+    ]
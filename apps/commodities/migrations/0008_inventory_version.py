@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0007_auto_20261017_2023'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
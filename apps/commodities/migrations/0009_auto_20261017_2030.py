@@ -0,0 +1,23 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0008_inventory_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['commodity', 'type', 'quantity'], name='commodities_commodi_77029c_idx'),
+        ),
+        migrations.AlterField(
+            model_name='inventory',
+            name='commodity',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='commodities.Commodity'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('commodities', '0009_auto_20261017_2030'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryHistoryArchive',
+            fields=[
+                ('action', models.CharField(choices=[('a', 'Add'), ('m', 'Modify'), ('d', 'Delete')], max_length=2)),
+                ('detail', models.CharField(blank=True, default='', max_length=512)),
+                ('type', models.IntegerField(choices=[(1, 'Shipping'), (2, 'Receiving')])),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('inventory', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='commodities.Inventory')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'commodities_inventory_history_archive',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventoryhistoryarchive',
+            index=models.Index(fields=['created_at'], name='commodities_created_fa2627_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryhistoryarchive',
+            index=models.Index(fields=['inventory', 'created_at'], name='commodities_invento_69d9f9_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:38
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_inventory_snapshots(apps, schema_editor):
+    # Rows of deleted inventories have lost their link and stay blank.
+    Inventory = apps.get_model('commodities', 'Inventory')
+    inventories = Inventory.objects.filter(pk=OuterRef('inventory'))
+
+    for name in ('InventoryHistory', 'InventoryHistoryArchive'):
+        model = apps.get_model('commodities', name)
+        model.objects.filter(inventory__isnull=False).update(
+            commodity_id=Subquery(inventories.values('commodity')[:1]),
+            commodity_name=Subquery(inventories.values('commodity__name')[:1]),
+            trade_partner_id=Subquery(inventories.values('trade_partner')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0010_auto_20261017_2035'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryhistory',
+            name='commodity',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='commodities.Commodity'),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistory',
+            name='commodity_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistory',
+            name='trade_partner',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='commodities.TradePartner'),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistoryarchive',
+            name='commodity',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='commodities.Commodity'),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistoryarchive',
+            name='commodity_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistoryarchive',
+            name='trade_partner',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='commodities.TradePartner'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryhistory',
+            index=models.Index(fields=['commodity', 'created_at'], name='commodities_commodi_6cff8b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryhistoryarchive',
+            index=models.Index(fields=['commodity', 'created_at'], name='commodities_commodi_b3fb95_idx'),
+        ),
+        migrations.RunPython(backfill_inventory_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.3 on 2026-10-17 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0011_auto_20261017_2038'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryImportCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('path', models.CharField(max_length=1024)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'commodities_inventory_import_checkpoint',
+                'ordering': ['name'],
+            },
+        ),
+    ]
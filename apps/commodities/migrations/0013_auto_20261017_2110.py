@@ -0,0 +1,32 @@
+# Generated by Django 3.0.3 on 2026-10-17 21:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_inventory_numbers(apps, schema_editor):
+    # Rows of deleted inventories have lost their link and stay blank.
+    for name in ('InventoryHistory', 'InventoryHistoryArchive'):
+        model = apps.get_model('commodities', name)
+        model.objects.filter(inventory__isnull=False).update(inventory_number=F('inventory'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commodities', '0012_inventoryimportcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryhistory',
+            name='inventory_number',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='inventoryhistoryarchive',
+            name='inventory_number',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_inventory_numbers, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
-from django.db import models
-from django.db.models import F, Q, Sum, Case, When, Value as V
-from django.db.models.functions import Coalesce
+from django.db import connections, models, transaction
+from django.db.models import F, Q, Count, Max, Sum, Case, When, Value as V
+from django.db.models.functions import Coalesce, TruncDay
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+import collections
 
 
 # Create your managers here.
@@ -13,25 +16,232 @@ class InventoryQuerySet(models.QuerySet):
     def receiving(self):
         return self.filter(type__exact=Inventory.Type.RECEIVING)
 
+    def for_trade_partner(self, trade_partner):
+        return self.filter(trade_partner=trade_partner)
+
+    def adjust(self, delta):
+        """
+        Add `delta` to the quantity of the selected inventories in a single
+        UPDATE, skipping any whose quantity would drop below zero.
+        """
+        return self.filter(quantity__gte=-delta) \
+            .update(quantity=F('quantity') + delta, version=F('version') + 1)
+
+class InventoryHistoryQuerySet(models.QuerySet):
+
+    def created_since(self, since):
+        return self.filter(created_at__gte=since)
+
+    def created_until(self, until):
+        return self.filter(created_at__lt=until)
+
+    def for_inventory(self, inventory):
+        return self.filter(inventory=inventory)
+
+    def for_commodity(self, commodity):
+        return self.filter(commodity=commodity)
+
+    def for_user(self, user):
+        return self.filter(user=user)
+
+    def last_created_at(self):
+        return self.aggregate(created_at=Max('created_at'))['created_at']
+
+class InventoryMovementRollupQuerySet(models.QuerySet):
+
+    def summarize(self, granularity):
+        SHIPPING = Inventory.Type.SHIPPING
+        RECEIVING = Inventory.Type.RECEIVING
+
+        if granularity == 'day':
+            queryset = self.annotate(period = TruncDay('bucket'))
+        else:
+            queryset = self.annotate(period = F('bucket'))
+
+        return queryset.values('commodity', 'trade_partner', 'period') \
+            .annotate(shipped_quantity = Coalesce(Sum('quantity', filter=Q(type=SHIPPING)), V(0))) \
+            .annotate(received_quantity = Coalesce(Sum('quantity', filter=Q(type=RECEIVING)), V(0))) \
+            .order_by('period', 'commodity', 'trade_partner')
+
 class InventoryManager(models.Manager):
 
-    def summarize(self):
+    def bulk_create_with_ids(self, inventories, batch_size=None):
+        """
+        bulk_create() that also sets the primary keys of `inventories`, which
+        history rows link to. PostgreSQL returns them from the INSERT, and on
+        SQLite they are read back; other backends insert one row at a time.
+        """
+        connection = connections[self.db]
+        if connection.features.can_return_rows_from_bulk_insert:
+            return self.bulk_create(inventories, batch_size=batch_size)
+
+        with transaction.atomic(using=self.db):
+            if connection.vendor != 'sqlite':
+                # Raw, like bulk_create(), so that the stock receivers leave
+                # the summary and rollups to the caller.
+                for inventory in inventories:
+                    inventory.save_base(raw=True, using=self.db)
+                return inventories
+
+            # SQLite allows one writer at a time, so until this transaction
+            # ends the newest rows are the ones it has just inserted.
+            self.bulk_create(inventories, batch_size=batch_size)
+            ids = self.order_by('-id').values_list('id', flat=True)[:len(inventories)]
+            for inventory, pk in zip(inventories, reversed(ids)):
+                inventory.pk = pk
+            return inventories
+
+    def summarize(self, group_by='commodity', trade_partner=None, min_total=None):
+        """
+        Quantities summed per commodity, trade partner or type, optionally
+        over one trade partner's inventories and only for the groups holding
+        at least `min_total`.
+        """
         SHIPPING = Inventory.Type.SHIPPING
         RECEIVING = Inventory.Type.RECEIVING
 
-        return self.values('commodity') \
-            .annotate(commodity_name = F('commodity__name')) \
+        queryset = self.get_queryset()
+        if trade_partner is not None:
+            queryset = queryset.for_trade_partner(trade_partner)
+
+        if group_by == 'trade_partner':
+            # values() keeps the inventories without a trade partner as a
+            # group of their own, where an F() annotation would drop them.
+            queryset = queryset.values('trade_partner', 'trade_partner__name')
+        elif group_by == 'type':
+            queryset = queryset.values('type')
+        else:
+            queryset = queryset.values('commodity') \
+                .annotate(commodity_name = F('commodity__name'))
+
+        queryset = queryset \
             .annotate(total_quantity = Coalesce(Sum('quantity'),  V(0))) \
             .annotate(shipping_quantity = Coalesce(Sum(Case(When(type=SHIPPING, then=F('quantity')), default=0)), V(0))) \
             .annotate(receiving_quantity = Coalesce(Sum('quantity', filter=Q(type=RECEIVING)), V(0))) \
             .order_by()
 
-    def list_glutted_commodities(self, quantity):
-        return self.values('commodity') \
+        if min_total is not None:
+            queryset = queryset.filter(total_quantity__gte=min_total)
+        return queryset
+
+    def list_glutted_commodities(self, quantity, commodity_trade_partner=None):
+        """
+        Commodities holding at least `quantity`, optionally only those whose
+        own trade partner is `commodity_trade_partner`. That is the partner
+        on the commodity, not on its inventories as in summarize().
+        """
+        queryset = self.all()
+        if commodity_trade_partner is not None:
+            queryset = queryset.filter(commodity__trade_partner=commodity_trade_partner)
+
+        return queryset.values('commodity') \
             .annotate(total_quantity = Coalesce(Sum('quantity'), V(0))) \
             .filter(total_quantity__gte=quantity) \
             .order_by('-total_quantity')
 
+class CommodityStockSummaryManager(models.Manager):
+
+    def add_inventories(self, inventories):
+        self.apply_many(inventories, 1)
+
+    def remove_inventories(self, inventories):
+        self.apply_many(inventories, -1)
+
+    def apply_many(self, inventories, sign):
+        deltas = collections.defaultdict(lambda: [0, 0])
+        for inventory in inventories:
+            delta = deltas[inventory.commodity_id, inventory.type]
+            delta[0] += sign * inventory.quantity
+            delta[1] += sign
+
+        for (commodity_id, type), (quantity, count) in deltas.items():
+            if quantity or count:
+                self.apply(commodity_id, type, quantity, count)
+
+    def apply(self, commodity_id, type, quantity, count=0):
+        deltas = {
+            'inventory_count': F('inventory_count') + count,
+            'total_quantity': F('total_quantity') + quantity,
+        }
+        if type == Inventory.Type.SHIPPING:
+            deltas['shipping_quantity'] = F('shipping_quantity') + quantity
+        elif type == Inventory.Type.RECEIVING:
+            deltas['receiving_quantity'] = F('receiving_quantity') + quantity
+
+        if not self.filter(commodity_id=commodity_id).update(**deltas):
+            self.get_or_create(commodity_id=commodity_id)
+            self.filter(commodity_id=commodity_id).update(**deltas)
+
+    def summarize(self, min_total=None):
+        """
+        The ledger's counterpart of InventoryManager.summarize() grouped by
+        commodity, where `min_total` needs no HAVING.
+        """
+        queryset = self.filter(inventory_count__gt=0)
+        if min_total is not None:
+            queryset = queryset.filter(total_quantity__gte=min_total)
+
+        return queryset.values('commodity', 'total_quantity', 'shipping_quantity', 'receiving_quantity') \
+            .annotate(commodity_name = F('commodity__name'))
+
+    def list_glutted_commodities(self, quantity, commodity_trade_partner=None):
+        """
+        The ledger's counterpart of InventoryManager.list_glutted_commodities().
+        """
+        queryset = self.filter(inventory_count__gt=0, total_quantity__gte=quantity)
+        if commodity_trade_partner is not None:
+            queryset = queryset.filter(commodity__trade_partner=commodity_trade_partner)
+
+        return queryset.values('commodity', 'total_quantity') \
+            .order_by('-total_quantity')
+
+    @transaction.atomic
+    def rebuild(self):
+        summaries = Inventory.objects.summarize() \
+            .annotate(inventory_count = Count('id')) \
+            .values_list('commodity', 'inventory_count', 'total_quantity', 'shipping_quantity', 'receiving_quantity')
+
+        self.all().delete()
+        self.bulk_create([
+            CommodityStockSummary(
+                commodity_id=commodity_id,
+                inventory_count=inventory_count,
+                total_quantity=total_quantity,
+                shipping_quantity=shipping_quantity,
+                receiving_quantity=receiving_quantity)
+            for commodity_id, inventory_count, total_quantity, shipping_quantity, receiving_quantity in summaries
+        ])
+
+
+class InventoryMovementRollupManager(models.Manager):
+
+    def record(self, added=(), removed=(), at=None):
+        bucket = self.get_bucket(at or timezone.now())
+
+        deltas = collections.Counter()
+        for inventory in added:
+            deltas[inventory.commodity_id, inventory.trade_partner_id, inventory.type] += inventory.quantity
+        for inventory in removed:
+            deltas[inventory.commodity_id, inventory.trade_partner_id, inventory.type] -= inventory.quantity
+
+        for (commodity_id, trade_partner_id, type), quantity in deltas.items():
+            if quantity:
+                self.apply(commodity_id, trade_partner_id, bucket, type, quantity)
+
+    def apply(self, commodity_id, trade_partner_id, bucket, type, quantity):
+        key = {
+            'commodity_id': commodity_id,
+            'trade_partner_id': trade_partner_id,
+            'bucket': bucket,
+            'type': type,
+        }
+        if not self.filter(**key).update(quantity=F('quantity') + quantity):
+            self.get_or_create(**key)
+            self.filter(**key).update(quantity=F('quantity') + quantity)
+
+    def get_bucket(self, at):
+        return at.replace(minute=0, second=0, microsecond=0)
+
 
 # Create your models here.
 class TradePartner(models.Model):
@@ -58,15 +268,22 @@ class Inventory(models.Model):
 
     type = models.IntegerField(choices=Type.choices)
     quantity =  models.PositiveIntegerField()
-    commodity = models.ForeignKey(Commodity, on_delete=models.CASCADE)
+    commodity = models.ForeignKey(Commodity, db_index=False, on_delete=models.CASCADE)
     trade_partner = models.ForeignKey(TradePartner, null=True, on_delete=models.SET_NULL)
+    version = models.PositiveIntegerField(default=1, editable=False)
     objects = InventoryManager.from_queryset(InventoryQuerySet)()
 
     class Meta:
         db_table = 'commodities_inventory'
         ordering = ['id']
+        indexes = [
+            # Covers summarize() and list_glutted_commodities(), which sum
+            # quantity by commodity and type without reading the table, and
+            # replaces the commodity foreign key index.
+            models.Index(fields=['commodity', 'type', 'quantity']),
+        ]
 
-class InventoryHistory(models.Model):
+class AbstractInventoryHistory(models.Model):
 
     class Action(models.TextChoices):
         ADD = 'a'
@@ -77,9 +294,23 @@ class InventoryHistory(models.Model):
     detail = models.CharField(max_length=512, default='', blank=True)
     type = models.IntegerField(choices=Inventory.Type.choices)
     quantity =  models.PositiveIntegerField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     inventory = models.ForeignKey(Inventory, db_index=False, null=True, on_delete=models.SET_NULL)
     user = models.ForeignKey(get_user_model(), null=True, on_delete=models.SET_NULL)
+    # Snapshot of the inventory when the event was written, which outlives
+    # the inventory itself and its commodity.
+    inventory_number = models.IntegerField(null=True, editable=False)
+    commodity = models.ForeignKey(Commodity, db_index=False, null=True, db_constraint=False,
+                                  on_delete=models.DO_NOTHING, related_name='+')
+    commodity_name = models.CharField(max_length=100, default='', blank=True)
+    trade_partner = models.ForeignKey(TradePartner, db_index=False, null=True, db_constraint=False,
+                                      on_delete=models.DO_NOTHING, related_name='+')
+    objects = InventoryHistoryQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+class InventoryHistory(AbstractInventoryHistory):
 
     class Meta:
         db_table = 'commodities_inventory_history'
@@ -87,4 +318,68 @@ class InventoryHistory(models.Model):
         indexes = [
             models.Index(fields=['created_at']),
             models.Index(fields=['inventory', 'created_at']),
+            models.Index(fields=['commodity', 'created_at']),
+        ]
+
+class InventoryHistoryArchive(AbstractInventoryHistory):
+    """
+    Cold tier of InventoryHistory; rows keep their id when they are moved
+    here by the archive_inventory_history command.
+    """
+    id = models.IntegerField(primary_key=True)
+
+    class Meta:
+        db_table = 'commodities_inventory_history_archive'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['inventory', 'created_at']),
+            models.Index(fields=['commodity', 'created_at']),
+        ]
+
+class CommodityStockSummary(models.Model):
+    commodity = models.OneToOneField(Commodity, primary_key=True, on_delete=models.CASCADE)
+    inventory_count = models.IntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    shipping_quantity = models.BigIntegerField(default=0)
+    receiving_quantity = models.BigIntegerField(default=0)
+    objects = CommodityStockSummaryManager()
+
+    class Meta:
+        db_table = 'commodities_commodity_stock_summary'
+        ordering = ['commodity']
+
+class InventoryMovementRollup(models.Model):
+    """
+    Net quantity moved per commodity, trade partner, type and hour.
+    """
+    commodity = models.ForeignKey(Commodity, on_delete=models.CASCADE)
+    trade_partner = models.ForeignKey(TradePartner, null=True, db_constraint=False, on_delete=models.DO_NOTHING)
+    bucket = models.DateTimeField()
+    type = models.IntegerField(choices=Inventory.Type.choices)
+    quantity = models.BigIntegerField(default=0)
+    objects = InventoryMovementRollupManager.from_queryset(InventoryMovementRollupQuerySet)()
+
+    class Meta:
+        db_table = 'commodities_inventory_movement_rollup'
+        ordering = ['bucket', 'commodity', 'trade_partner', 'type']
+        constraints = [
+            models.UniqueConstraint(fields=['commodity', 'trade_partner', 'bucket', 'type'], name='unique_movement_rollup'),
         ]
+        indexes = [
+            models.Index(fields=['bucket']),
+        ]
+
+class InventoryImportCheckpoint(models.Model):
+    """
+    Rows of `path` committed so far by an import_inventories run, updated
+    in the same transaction as the rows themselves.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    path = models.CharField(max_length=1024)
+    rows = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'commodities_inventory_import_checkpoint'
+        ordering = ['name']
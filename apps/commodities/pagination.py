@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.db import connections
+
+from rest_framework import pagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from apps.commodities import cache
+
+from collections import OrderedDict
+
+import hashlib
+import json
+
+
+class CachedCountLimitOffsetPagination(pagination.LimitOffsetPagination):
+    """
+    LimitOffsetPagination whose COUNT(*) is cached per query for
+    `PAGINATION_COUNT_CACHE_TIMEOUT` seconds.
+
+    On PostgreSQL, a query the planner estimates at
+    `PAGINATION_COUNT_ESTIMATE_THRESHOLD` rows or more is not counted at all
+    and the estimate is returned instead. `count_exact` in the response is
+    only true for a COUNT(*) run by this very request, or when the page
+    reaches the end of the results and so gives the count away.
+
+    Since the count may be stale or estimated, it is never used to decide
+    what to fetch: the page is always read, one row past `limit` to tell
+    whether there is a next page.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = self.get_count(queryset)
+        self.offset = self.get_offset(request)
+        self.request = request
+
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        if not self.has_next and (results or not self.offset):
+            self.count, self.count_exact = self.offset + len(results), True
+        if self.template is not None and (self.has_next or self.offset):
+            self.display_page_controls = True
+        return results[:self.limit]
+
+    def get_count(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.md5('{}|{}|{}'.format(queryset.db, sql, params).encode('utf-8')).hexdigest()
+        key = 'pagination:count:{}'.format(digest)
+
+        counts = cache.get_cache()
+        count = counts.get(key)
+        if count is not None:
+            # Exact when cached, but possibly stale since.
+            self.count_exact = False
+            return count
+
+        estimate = self.estimate_count(queryset, sql, params)
+        if estimate is not None:
+            count, self.count_exact = estimate
+        else:
+            count, self.count_exact = super().get_count(queryset), True
+        counts.set(key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 10))
+        return count
+
+    def estimate_count(self, queryset, sql, params):
+        threshold = getattr(settings, 'PAGINATION_COUNT_ESTIMATE_THRESHOLD', None)
+        connection = connections[queryset.db]
+        if threshold is None or connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        return (estimate, False) if estimate >= threshold else None
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count_exact'] = {
+            'type': 'boolean',
+            'example': True,
+        }
+        return schema
@@ -0,0 +1,147 @@
+from django.conf import settings
+
+from rest_framework import parsers
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+import csv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class _Echo:
+    """
+    File-like object whose write() hands the line back, so csv.writer can be
+    driven one row at a time without an intermediate buffer.
+    """
+
+    def write(self, value):
+        return value
+
+class StreamingRenderer(renderers.BaseRenderer):
+    """
+    Base for line oriented export formats.
+
+    `stream()` turns a header and an iterable of row tuples into an iterable
+    of encoded chunks for StreamingHttpResponse; `render()` is only used for
+    ordinary (e.g. error) responses.
+    """
+    lines_per_chunk = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return b''
+
+        header = list(rows[0].keys())
+        return b''.join(self.stream(header, ([row.get(name) for name in header] for row in rows)))
+
+    def stream(self, header, rows):
+        lines = [self.render_header(header)]
+        for row in rows:
+            lines.append(self.render_row(header, row))
+            if len(lines) >= self.lines_per_chunk:
+                yield ''.join(lines).encode(self.charset)
+                lines = []
+
+        if lines:
+            yield ''.join(lines).encode(self.charset)
+
+    def render_header(self, header):
+        raise NotImplementedError('Streaming renderers must implement .render_header()')
+
+    def render_row(self, header, row):
+        raise NotImplementedError('Streaming renderers must implement .render_row()')
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+        self.encoder = encoders.JSONEncoder()
+
+    def render_header(self, header):
+        return self.writer.writerow(header)
+
+    def render_row(self, header, row):
+        return self.writer.writerow([self._format_value(value) for value in row])
+
+    def _format_value(self, value):
+        if value is None or isinstance(value, (str, int, float)):
+            return value
+        try:
+            return self.encoder.default(value)
+        except TypeError:
+            return str(value)
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def __init__(self):
+        self.encoder = encoders.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def render_header(self, header):
+        return ''
+
+    def render_row(self, header, row):
+        return self.encoder.encode(dict(zip(header, row))) + '\n'
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    orjson writes UTF-8 bytes straight from the data, with no intermediate
+    str to encode. Datetimes and any type orjson does not know (Decimal,
+    UUID, lazy strings, ...) go through DRF's encoder, so the output matches
+    JSONRenderer's. Indented output, ASCII-only output and a missing orjson
+    fall back to JSONRenderer.
+    """
+    options = 0 if orjson is None else orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if orjson is None or indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the stdlib encoder handles.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped by JSONRenderer as well, for the sake of JSONP/JavaScript.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser that decodes UTF-8 request bodies with orjson when it is
+    installed.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8' or not api_settings.STRICT_JSON:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
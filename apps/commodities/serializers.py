@@ -1,13 +1,56 @@
+from django.core.exceptions import ImproperlyConfigured
+
 from rest_framework import serializers
 
 from apps.commodities.models import TradePartner, Commodity, Inventory, InventoryHistory
 
+from collections.abc import Mapping
+import functools
+
+def get_value_converter(field):
+    if isinstance(field, serializers.ChoiceField):
+        lookup = field.choice_strings_to_values.get
+        return lambda value: value if value in ('', None) else lookup(str(value), value)
+    elif isinstance(field, serializers.IntegerField):
+        return lambda value: None if value is None else int(value)
+    elif isinstance(field, serializers.CharField):
+        return lambda value: None if value is None else str(value)
+    raise ImproperlyConfigured('{} has no fast representation'.format(field.__class__.__name__))
+
+class ValuesSerializerMixin:
+    """
+    Read-only fast path for lists: rows fetched with `.values()` are
+    represented through accessors compiled once per class, instead of
+    dispatching through every field's get_attribute/to_representation. The
+    output is the same as the regular path's.
+    """
+
+    @classmethod
+    def get_value_sources(cls, names):
+        return [key for _, key, _ in cls.get_value_accessors(tuple(names))]
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def get_value_accessors(cls, names):
+        fields = cls().fields
+        return tuple(
+            (name, fields[name].source.replace('.', '__'), get_value_converter(fields[name]))
+            for name in names
+        )
+
+    @classmethod
+    def represent_values(cls, rows, names, compact=False):
+        accessors = cls.get_value_accessors(tuple(names))
+        if compact:
+            return [[convert(row[key]) for _, key, convert in accessors] for row in rows]
+        return [{name: convert(row[key]) for name, key, convert in accessors} for row in rows]
+
 class TradePartnerSerializer(serializers.ModelSerializer):
     class Meta:
         model = TradePartner
         fields = ['id', 'name', 'address']
 
-class TradePartnerListSerializer(serializers.ModelSerializer):
+class TradePartnerListSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = TradePartner
         fields = ['id', 'name']
@@ -17,7 +60,7 @@ class CommoditySerializer(serializers.ModelSerializer):
         model = Commodity
         fields = ['id', 'name', 'description', 'trade_partner']
 
-class CommodityListSerializer(serializers.ModelSerializer):
+class CommodityListSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Commodity
         fields = ['id', 'name']
@@ -30,26 +73,151 @@ class InventorySerializer(serializers.ModelSerializer):
         fields = ['id', 'type', 'quantity', 'commodity', 'trade_partner']
         read_only_fields = ['commodity']
 
+class InventoryAdjustSerializer(serializers.Serializer):
+    delta = serializers.IntegerField()
+
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError('delta must not be zero')
+        return value
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks primary keys up in `prefetched` once the parent list serializer has
+    loaded them in bulk, instead of with one query per item.
+    """
+    prefetched = None
+
+    def prefetch(self, values):
+        pks = set()
+        for value in values:
+            try:
+                pks.add(int(value))
+            except (TypeError, ValueError):
+                pass
+        self.prefetched = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self.prefetched is None or self.pk_field is not None:
+            return super().to_internal_value(data)
+        try:
+            return self.prefetched[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class InventoryBulkCreateSerializer(serializers.ListSerializer):
+    """
+    Validates every item on its own, so that one bad movement does not reject
+    the whole batch. Rejected items are reported in `item_errors` by index.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.item_errors = []
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        ret = []
+        self.item_errors = []
+
+        items = [item for item in data if isinstance(item, Mapping)]
+        for field in self.child.fields.values():
+            if isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                field.prefetch(item[field.field_name] for item in items if field.field_name in item)
+
+        for index, item in enumerate(data):
+            try:
+                ret.append(self.child.run_validation(item))
+            except serializers.ValidationError as exc:
+                self.item_errors.append({'index': index, 'errors': exc.detail})
+
+        return ret
+
+    def create(self, validated_data):
+        # The history rows need the primary keys.
+        instances = [Inventory(**attrs) for attrs in validated_data]
+        return Inventory.objects.bulk_create_with_ids(instances)
+
 class InventoryCreateSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Inventory
         fields = ['id', 'type', 'quantity', 'commodity', 'trade_partner']
+        list_serializer_class = InventoryBulkCreateSerializer
 
-class InventoryListSerializer(serializers.ModelSerializer):
+class InventoryListSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     commodity_name = serializers.CharField(source='commodity.name')
 
     class Meta:
         model = Inventory
         fields = ['id', 'type', 'quantity', 'commodity_name']
 
-class InventorySummarySerializer(serializers.Serializer):
+class InventorySummarySerializer(ValuesSerializerMixin, serializers.Serializer):
     commodity_id = serializers.IntegerField(source='commodity', min_value=1)
     commodity_name = serializers.CharField()
     total_quantity = serializers.IntegerField(min_value=0)
     shipping_quantity = serializers.IntegerField(min_value=0)
     receiving_quantity = serializers.IntegerField(min_value=0)
 
+class InventoryTradePartnerSummarySerializer(ValuesSerializerMixin, serializers.Serializer):
+    trade_partner_id = serializers.IntegerField(source='trade_partner', allow_null=True)
+    trade_partner_name = serializers.CharField(source='trade_partner__name', allow_null=True)
+    total_quantity = serializers.IntegerField(min_value=0)
+    shipping_quantity = serializers.IntegerField(min_value=0)
+    receiving_quantity = serializers.IntegerField(min_value=0)
+
+class InventoryTypeSummarySerializer(ValuesSerializerMixin, serializers.Serializer):
+    type = serializers.ChoiceField(choices=Inventory.Type.choices)
+    total_quantity = serializers.IntegerField(min_value=0)
+    shipping_quantity = serializers.IntegerField(min_value=0)
+    receiving_quantity = serializers.IntegerField(min_value=0)
+
+class InventorySummaryFilterSerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(choices=['commodity', 'trade_partner', 'type'], default='commodity')
+    trade_partner = serializers.IntegerField(required=False, min_value=1)
+    min_total = serializers.IntegerField(required=False, min_value=0)
+    # A field of the grouping's serializer, optionally prefixed with "-".
+    ordering = serializers.CharField(required=False)
+
 class InventoryHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = InventoryHistory
-        exclude = ['inventory', 'user']
+        exclude = ['inventory', 'inventory_number', 'user']
+
+class InventoryHistoryFilterSerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    inventory = serializers.IntegerField(required=False, min_value=1)
+    commodity = serializers.IntegerField(required=False, min_value=1)
+    action = serializers.ChoiceField(choices=InventoryHistory.Action.choices, required=False)
+    user = serializers.IntegerField(required=False, min_value=1)
+    ordering = serializers.ChoiceField(choices=['created_at', '-created_at'], default='created_at')
+
+    def validate(self, attrs):
+        if 'since' in attrs and 'until' in attrs and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError('since must be earlier than until')
+        return attrs
+
+class InventoryMovementSerializer(serializers.Serializer):
+    commodity_id = serializers.IntegerField(source='commodity', min_value=1)
+    trade_partner_id = serializers.IntegerField(source='trade_partner', allow_null=True)
+    bucket = serializers.DateTimeField(source='period')
+    shipped_quantity = serializers.IntegerField()
+    received_quantity = serializers.IntegerField()
+
+class InventoryMovementFilterSerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    commodity = serializers.IntegerField(required=False, min_value=1)
+    trade_partner = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        if 'since' in attrs and 'until' in attrs and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError('since must be earlier than until')
+        return attrs
@@ -2,23 +2,75 @@ from django.dispatch import Signal, receiver
 from django.db.models import signals
 
 from datetime import datetime
-from apps.commodities.models import Inventory, InventoryHistory
+from apps.commodities import audit
+from apps.commodities.models import Inventory, InventoryHistory, CommodityStockSummary, InventoryMovementRollup
 
 inventory_saved = Signal(providing_args=["instance", "user", "created"])
 inventory_deleted = Signal(providing_args=["pk", "instance", "user"])
 
-@receiver(inventory_saved, sender=Inventory)
-def log_inventory_save(sender, instance, user, created, **kwargs):
+def get_inventory_snapshot(instance):
+    # Copied onto the log so audit reads need no join and survive the
+    # inventory's deletion.
+    return {
+        'commodity_id': instance.commodity_id,
+        'commodity_name': instance.commodity.name,
+        'trade_partner_id': instance.trade_partner_id,
+    }
+
+def make_inventory_save_log(instance, user, created):
     action = InventoryHistory.Action.ADD if created else InventoryHistory.Action.MODIFY
     detail = 'inventory (#{}) adjusted by {} (#{})'.format(instance.id, user.username, user.id)
 
-    log = InventoryHistory(action=action, detail=detail, quantity=instance.quantity, type=instance.type, inventory=instance, user=user)
-    log.save()
+    return InventoryHistory(action=action, detail=detail, quantity=instance.quantity, type=instance.type,
+                            inventory=instance, inventory_number=instance.id, user=user,
+                            **get_inventory_snapshot(instance))
 
-@receiver(inventory_deleted, sender=Inventory)
-def log_inventory_delete(sender, pk, instance, user, **kwargs):
+def make_inventory_delete_log(pk, instance, user):
     action = InventoryHistory.Action.DELETE
     detail = 'inventory (#{}) deleted by {} (#{})'.format(pk, user.username, user.id)
 
-    log = InventoryHistory(action=action, detail=detail, quantity=instance.quantity, type=instance.type, user=user)
-    log.save()
+    return InventoryHistory(action=action, detail=detail, quantity=instance.quantity, type=instance.type,
+                            inventory_number=pk, user=user, **get_inventory_snapshot(instance))
+
+@receiver(inventory_saved, sender=Inventory)
+def log_inventory_save(sender, instance, user, created, **kwargs):
+    log = make_inventory_save_log(instance, user, created)
+    audit.get_sink().emit([log])
+
+@receiver(inventory_deleted, sender=Inventory)
+def log_inventory_delete(sender, pk, instance, user, **kwargs):
+    log = make_inventory_delete_log(pk, instance, user)
+    audit.get_sink().emit([log])
+
+def record_stock_change(added=(), removed=()):
+    """
+    Moves inventories into and out of the stock summary and the movement
+    rollups. save() and delete() do it through the receivers below;
+    bulk_create() and update() send no signals, so their callers do.
+    """
+    CommodityStockSummary.objects.remove_inventories(removed)
+    CommodityStockSummary.objects.add_inventories(added)
+    InventoryMovementRollup.objects.record(added, removed)
+
+@receiver(signals.pre_save, sender=Inventory)
+def load_stock_original(sender, instance, raw, **kwargs):
+    # The stored state is what the save moves out, whatever the caller
+    # changed on the instance since loading it.
+    instance._stock_original = None
+    if not raw and not instance._state.adding:
+        instance._stock_original = Inventory.objects.filter(pk=instance.pk) \
+            .only('commodity', 'trade_partner', 'type', 'quantity').first()
+
+@receiver(signals.post_save, sender=Inventory)
+def record_stock_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+
+    original = getattr(instance, '_stock_original', None)
+    record_stock_change(added=[instance], removed=[original] if original else [])
+
+@receiver(signals.pre_delete, sender=Inventory)
+def record_stock_delete(sender, instance, **kwargs):
+    # Before the delete: when a commodity is deleted, its summary and rollup
+    # rows are only removed after pre_delete, so rows this touches go too.
+    record_stock_change(removed=[instance])
@@ -1,15 +1,48 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.http import Http404
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
 
 from model_bakery import baker
 
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.settings import api_settings
 from rest_framework.test import APIRequestFactory, APISimpleTestCase, APITestCase
 
-from apps.commodities.views import LinkHeaderPagination
-from apps.commodities.models import Inventory, InventoryHistory
+from io import BytesIO, StringIO
+
+from unittest import mock, skipUnless
+
+import asyncio
+import base64
+import datetime
+import decimal
+import json
+import os
+import tempfile
+import threading
+
+from django_freight import database
+from django_freight import instrumentation
+from django_freight.handlers import ReadPoolASGIHandler
+
+from apps.commodities import audit
+from apps.commodities import renderers
+from apps.commodities import serializers
+from apps.commodities import signals
+from apps.commodities.management.commands import explain_inventory_queries
+from apps.commodities.pagination import CachedCountLimitOffsetPagination
+from apps.commodities.views import LinkHeaderPagination, CursorLinkHeaderPagination, InventoryViewSet
+from apps.commodities.models import TradePartner, Commodity, Inventory, InventoryHistory, InventoryHistoryArchive, \
+    InventoryImportCheckpoint, CommodityStockSummary, InventoryMovementRollup
 
 # Create your tests here.
 class InventoryViewSetTestCase(APITestCase):
@@ -33,6 +66,7 @@ class InventoryViewSetTestCase(APITestCase):
     def setUp(self):
         super().setUp()
 
+        cache.clear()
         self.client.force_authenticate(user=self.user)
 
     def tearDown(self):
@@ -88,6 +122,87 @@ class InventoryViewSetTestCase(APITestCase):
         self.assert_inventory_history_match(
             history, InventoryHistory.Action.ADD, self.user)
 
+    def test_bulk_create_view(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        items = [
+            {'type': Inventory.Type.SHIPPING, 'quantity': 1, 'commodity': commodity.pk},
+            {'type': Inventory.Type.RECEIVING, 'quantity': 2, 'commodity': commodity.pk},
+            {'type': Inventory.Type.SHIPPING, 'quantity': 3, 'commodity': commodity.pk},
+        ]
+
+        # When
+        url = reverse('inventory-bulk')
+        response = self.client.post(url, data=items, format='json')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['results']), len(items))
+        self.assertListEqual(response.data['errors'], [])
+
+        pks = [data['id'] for data in response.data['results']]
+        histories = InventoryHistory.objects.filter(inventory__in=pks)
+        self.assertEqual(histories.count(), len(items))
+        for history in histories:
+            self.assert_inventory_history_match(
+                history, InventoryHistory.Action.ADD, self.user)
+
+        summary = CommodityStockSummary.objects.get(commodity=commodity)
+        self.assertEqual(summary.inventory_count, 3)
+        self.assertEqual(summary.shipping_quantity, 4)
+        self.assertEqual(summary.receiving_quantity, 2)
+
+    def test_bulk_create_view_inserts_in_bulk(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        items = [{'type': Inventory.Type.SHIPPING, 'quantity': quantity, 'commodity': commodity.pk}
+                 for quantity in range(5)]
+
+        # When
+        url = reverse('inventory-bulk')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data=items, format='json')
+
+        # Then
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "commodities_inventory"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertListEqual(
+            [(data['id'], data['quantity']) for data in response.data['results']],
+            list(Inventory.objects.values_list('id', 'quantity')))
+        self.assertListEqual(
+            list(InventoryHistory.objects.values_list('inventory', 'quantity')),
+            list(Inventory.objects.values_list('id', 'quantity')))
+
+    def test_bulk_create_view_partial_errors(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        items = [
+            {'type': Inventory.Type.SHIPPING, 'quantity': 1, 'commodity': commodity.pk},
+            {'type': 9, 'quantity': 1, 'commodity': commodity.pk},
+            {'type': Inventory.Type.RECEIVING, 'quantity': 2, 'commodity': commodity.pk},
+        ]
+
+        # When
+        url = reverse('inventory-bulk')
+        response = self.client.post(url, data=items, format='json')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(len(response.data['errors']), 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('type', response.data['errors'][0]['errors'])
+        self.assertEqual(Inventory.objects.count(), 2)
+
+    def test_bulk_create_view_not_a_list(self):
+        # When
+        url = reverse('inventory-bulk')
+        response = self.client.post(url, data={'quantity': 1}, format='json')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_retrieve_view(self):
         # Given
         expected = baker.make_recipe('apps.commodities.inventory')
@@ -147,6 +262,80 @@ class InventoryViewSetTestCase(APITestCase):
         self.assert_inventory_history_match(
             history, InventoryHistory.Action.DELETE, self.user)
 
+    def test_history_keeps_snapshot_of_deleted_inventory(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        commodity = inventory.commodity
+        url = reverse('inventory-detail', args=[inventory.pk])
+        self.client.put(url, data={'type': inventory.type, 'quantity': 5})
+
+        # When
+        self.client.delete(url)
+
+        # Then
+        for history in InventoryHistory.objects.all():
+            self.assertIsNone(history.inventory_id)
+            self.assertEqual(history.commodity_id, commodity.pk)
+            self.assertEqual(history.commodity_name, commodity.name)
+            self.assertEqual(history.trade_partner_id, inventory.trade_partner_id)
+
+    def test_update_view_if_match(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        url = reverse('inventory-detail', args=[inventory.pk])
+        etag = self.client.get(url)['ETag']
+        data = {'type': Inventory.Type.RECEIVING, 'quantity': 2}
+
+        # When
+        response = self.client.put(url, data=data, HTTP_IF_MATCH=etag)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(Inventory.objects.get(pk=inventory.pk).version, 2)
+
+        # When
+        response = self.client.put(url, data=data, HTTP_IF_MATCH=etag)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(InventoryHistory.objects.count(), 1)
+
+    def test_adjust_view(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory', quantity=5)
+        CommodityStockSummary.objects.rebuild()
+        url = reverse('inventory-adjust', args=[inventory.pk])
+
+        # When
+        response = self.client.patch(url, data={'delta': -3}, format='json')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity'], 2)
+        self.assertEqual(response['ETag'], '"2"')
+
+        summary = CommodityStockSummary.objects.get(commodity=inventory.commodity)
+        self.assertEqual(summary.total_quantity, 2)
+
+        history = InventoryHistory.objects.last()
+        self.assert_inventory_history_match(
+            history, InventoryHistory.Action.MODIFY, self.user)
+        self.assertEqual(history.quantity, 2)
+
+        # When
+        response = self.client.patch(url, data={'delta': -3}, format='json')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Inventory.objects.get(pk=inventory.pk).quantity, 2)
+
+        # When
+        response = self.client.patch(url, data={'delta': 1}, format='json', HTTP_IF_MATCH='"1"')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
     def test_summary_view(self):
         # Given
         shipping = Inventory.Type.SHIPPING
@@ -198,107 +387,1621 @@ class InventoryViewSetTestCase(APITestCase):
             self.assertEqual(data['shipping_quantity'], expected[i]['shipping_quantity'])
             self.assertEqual(data['receiving_quantity'], expected[i]['receiving_quantity'])
 
-    def assert_inventory_history_match(self, history, action, user):
-        self.assertEqual(history.action, action)
-        self.assertEqual(history.user, user)
+    def test_summary_view_filters(self):
+        # Given
+        dhl, ups = baker.make_recipe('apps.commodities.trade_partner', _quantity=2)
+        c1, c2, c3 = baker.make_recipe('apps.commodities.commodity', trade_partner=ups, _quantity=3)
 
-class LinkHeaderPaginationTestCase(APISimpleTestCase):
-    @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
+        baker.make_recipe('apps.commodities.inventory', quantity=5, commodity=c1, trade_partner=dhl)
+        baker.make_recipe('apps.commodities.inventory', quantity=20, commodity=c2, trade_partner=dhl)
+        baker.make_recipe('apps.commodities.inventory', quantity=30, commodity=c2, trade_partner=dhl)
+        baker.make_recipe('apps.commodities.inventory', quantity=40, commodity=c3, trade_partner=ups)
+        baker.make_recipe('apps.commodities.inventory', quantity=1, commodity=c3, trade_partner=None)
 
-        cls.factory = APIRequestFactory()
+        CommodityStockSummary.objects.rebuild()
 
-    @classmethod
-    def tearDownClass(cls):
-        super().tearDownClass()
+        # When
+        url = reverse('inventory-summary')
+        response = self.client.get(url, {'trade_partner': dhl.pk, 'min_total': 10})
 
-    def setUp(self):
-        super().setUp()
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(
+            [(data['commodity_id'], data['total_quantity']) for data in response.data['results']], [(c2.pk, 50)])
 
-    def tearDown(self):
-        super().tearDown()
+        # When
+        response = self.client.get(url, {'group_by': 'trade_partner', 'ordering': '-total_quantity'})
 
-    def test_get_link(self):
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(
+            [(data['trade_partner_id'], data['total_quantity']) for data in response.data['results']],
+            [(dhl.pk, 55), (ups.pk, 40), (None, 1)])
+
+        # When
+        response = self.client.get(url, {'trade_partner': ups.pk})
+
+        # Then
+        self.assertListEqual(
+            [(data['commodity_id'], data['total_quantity']) for data in response.data['results']], [(c3.pk, 40)])
+
+        # When
+        response = self.client.get(url, {'group_by': 'type', 'min_total': 1})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(response.data['results'], [{
+            'type': Inventory.Type.SHIPPING,
+            'total_quantity': 96,
+            'shipping_quantity': 96,
+            'receiving_quantity': 0,
+        }])
+
+    def test_summary_view_invalid_ordering(self):
+        # When
+        url = reverse('inventory-summary')
+        response = self.client.get(url, {'group_by': 'type', 'ordering': 'commodity_name'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stock_summary_follows_mutations(self):
         # Given
-        url, page, size, rel = '/api/pages/', 0, 30, 'next'
-        request = self.factory.get(url)
-        queryset = [1]
-        expected = '<http://testserver{}?page={}&page_size={}>; rel="{}"'.format(
-            url, page, size, rel)
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        url = reverse('inventory-list')
 
         # When
-        paginator = LinkHeaderPagination()
-        paginator.paginate_queryset(queryset, request)
-        link = paginator.get_link(page, size, rel)
+        response = self.client.post(url, data={
+            'type': Inventory.Type.SHIPPING,
+            'quantity': 5,
+            'commodity': commodity.pk,
+        })
+        self.client.post(url, data={
+            'type': Inventory.Type.RECEIVING,
+            'quantity': 7,
+            'commodity': commodity.pk,
+        })
+
+        detail_url = reverse('inventory-detail', args=[response.data['id']])
+        self.client.put(detail_url, data={'type': Inventory.Type.RECEIVING, 'quantity': 2})
 
         # Then
-        self.assertEqual(link, expected)
+        summary = CommodityStockSummary.objects.get(commodity=commodity)
+        self.assertEqual(summary.inventory_count, 2)
+        self.assertEqual(summary.total_quantity, 9)
+        self.assertEqual(summary.shipping_quantity, 0)
+        self.assertEqual(summary.receiving_quantity, 9)
 
-    def test_paginate_queryset_empty_page(self):
+        # When
+        self.client.delete(detail_url)
+
+        # Then
+        summary.refresh_from_db()
+        self.assertEqual(summary.inventory_count, 1)
+        self.assertEqual(summary.total_quantity, 7)
+        self.assertEqual(summary.receiving_quantity, 7)
+
+    def test_stock_summary_follows_model_writes(self):
         # Given
-        page, page_size, url = 2, api_settings.PAGE_SIZE, '/api/pages/'
-        request = self.factory.get(url, {'page': page})
-        queryset = [1]
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        inventory = baker.make_recipe('apps.commodities.inventory', type=Inventory.Type.SHIPPING, quantity=5,
+                                      commodity=commodity, trade_partner=None)
+        baker.make_recipe('apps.commodities.inventory', type=Inventory.Type.RECEIVING, quantity=7,
+                          commodity=commodity, trade_partner=None)
 
         # When
-        with self.assertRaises(Http404):
-            paginator = LinkHeaderPagination()
-            paginator.paginate_queryset(queryset, request)
+        inventory.quantity = 2
+        inventory.save()
 
-    def test_get_paginated_response_first_page(self):
+        # Then
+        summary = CommodityStockSummary.objects.get(commodity=commodity)
+        self.assertEqual(summary.inventory_count, 2)
+        self.assertEqual(summary.total_quantity, 9)
+        self.assertEqual(summary.shipping_quantity, 2)
+        self.assertListEqual(
+            [(row['shipped_quantity'], row['received_quantity'])
+             for row in InventoryMovementRollup.objects.summarize('hour')],
+            [(2, 7)])
+
+        # When
+        inventory.delete()
+
+        # Then
+        summary.refresh_from_db()
+        self.assertEqual(summary.inventory_count, 1)
+        self.assertEqual(summary.total_quantity, 7)
+        self.assertEqual(summary.shipping_quantity, 0)
+
+        # When
+        commodity.delete()
+
+        # Then
+        self.assertFalse(CommodityStockSummary.objects.exists())
+        self.assertFalse(InventoryMovementRollup.objects.exists())
+
+    def test_rebuild_stock_summary_command(self):
         # Given
-        page_size, url = api_settings.PAGE_SIZE, '/api/pages/'
-        request = self.factory.get(url)
-        queryset = list(range(page_size + 1))
-        expected = queryset[:page_size]
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        baker.make_recipe('apps.commodities.inventory', quantity=3, commodity=commodity)
+        baker.make_recipe('apps.commodities.inventory', quantity=4, commodity=commodity)
 
         # When
-        paginator = LinkHeaderPagination()
-        data = paginator.paginate_queryset(queryset, request)
-        response = paginator.get_paginated_response(data)
+        call_command('rebuild_stock_summary', stdout=StringIO())
 
         # Then
-        self.assertListEqual(response.data, expected)
-        self.assertIn('rel=\"next\"', response['Link'])
-        self.assertIn('rel=\"last\"', response['Link'])
-        self.assertNotIn('rel=\"first\"', response['Link'])
-        self.assertNotIn('rel=\"prev\"', response['Link'])
+        summary = CommodityStockSummary.objects.get(commodity=commodity)
+        self.assertEqual(summary.inventory_count, 2)
+        self.assertEqual(summary.total_quantity, 7)
+        self.assertEqual(summary.shipping_quantity, 7)
 
-    def test_get_paginated_response_middle_page(self):
+    def test_history_view(self):
         # Given
-        page, page_size, url = 2, 5, '/api/pages/'
-        request = self.factory.get(url, {'page': page, 'page_size': page_size})
-        queryset = list(range(page_size * 3))
-        expected = queryset[page_size:page_size+page_size]
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        url = reverse('inventory-detail', args=[inventory.pk])
+        for quantity in range(3):
+            self.client.put(url, data={'type': inventory.type, 'quantity': quantity})
 
         # When
-        paginator = LinkHeaderPagination()
-        data = paginator.paginate_queryset(queryset, request)
-        response = paginator.get_paginated_response(data)
+        url = reverse('inventory-history')
+        response = self.client.get(url, {'page_size': 2})
 
         # Then
-        self.assertListEqual(response.data, expected)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([data['quantity'] for data in response.data], [0, 1])
         self.assertIn('rel=\"next\"', response['Link'])
-        self.assertIn('rel=\"last\"', response['Link'])
-        self.assertIn('rel=\"first\"', response['Link'])
-        self.assertIn('rel=\"prev\"', response['Link'])
+        self.assertNotIn('rel=\"prev\"', response['Link'])
 
-    def test_get_paginated_response_last_page(self):
+    def test_history_view_filters(self):
         # Given
-        page, page_size, url = 2, api_settings.PAGE_SIZE, '/api/pages/'
-        request = self.factory.get(url, {'page': page})
-        queryset = list(range(page_size + 1))
-        expected = queryset[page_size:]
+        inventories = baker.make_recipe('apps.commodities.inventory', _quantity=2)
+        for inventory in inventories:
+            url = reverse('inventory-detail', args=[inventory.pk])
+            self.client.put(url, data={'type': inventory.type, 'quantity': 5})
+            self.client.put(url, data={'type': inventory.type, 'quantity': 6})
+        InventoryHistory.objects.filter(inventory=inventories[0]).update(created_at='2020-01-01T00:00:00Z')
 
         # When
-        paginator = LinkHeaderPagination()
-        data = paginator.paginate_queryset(queryset, request)
-        response = paginator.get_paginated_response(data)
+        url = reverse('inventory-history')
+        response = self.client.get(url, {
+            'since': '2020-02-01T00:00:00Z',
+            'inventory': inventories[1].pk,
+            'action': InventoryHistory.Action.MODIFY,
+            'user': self.user.pk,
+            'ordering': '-created_at',
+            'page_size': 1,
+        })
 
         # Then
-        self.assertListEqual(response.data, expected)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([data['quantity'] for data in response.data], [6])
+
+        # When
+        next_url = response['Link'].split(';')[0][1:-1]
+        response = self.client.get(next_url)
+
+        # Then
+        self.assertListEqual([data['quantity'] for data in response.data], [5])
         self.assertNotIn('rel=\"next\"', response['Link'])
-        self.assertNotIn('rel=\"last\"', response['Link'])
-        self.assertIn('rel=\"first\"', response['Link'])
-        self.assertIn('rel=\"prev\"', response['Link'])
+
+    def test_history_view_commodity_filter(self):
+        # Given
+        commodities = baker.make_recipe('apps.commodities.commodity', _quantity=2)
+        for commodity in commodities:
+            inventory = baker.make_recipe('apps.commodities.inventory', commodity=commodity)
+            url = reverse('inventory-detail', args=[inventory.pk])
+            self.client.put(url, data={'type': inventory.type, 'quantity': 5})
+
+        # When
+        url = reverse('inventory-history')
+        response = self.client.get(url, {'commodity': commodity.pk})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['commodity'], commodity.pk)
+        self.assertEqual(response.data[0]['commodity_name'], commodity.name)
+
+    def test_history_view_tampered_cursor(self):
+        for position in (['not-a-date', 1], [[1], 1], ['2020-01-01', 1], [1, 1]):
+            # Given
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode('utf-8')).decode('ascii')
+
+            # When
+            response = self.client.get(reverse('inventory-history'), {'cursor': cursor})
+
+            # Then
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+
+    def test_history_view_invalid_filter(self):
+        # When
+        url = reverse('inventory-history')
+        response = self.client.get(url, {'ordering': 'detail'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_history_export_csv(self):
+        # Given
+        inventories = baker.make_recipe('apps.commodities.inventory', _quantity=2)
+        for inventory in inventories:
+            url = reverse('inventory-detail', args=[inventory.pk])
+            self.client.put(url, data={'type': inventory.type, 'quantity': 5})
+
+        # When
+        url = reverse('inventory-history-export')
+        response = self.client.get(url, {'format': 'csv', 'inventory': inventories[1].pk})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(
+            lines[0], 'id,action,detail,type,quantity,created_at,inventory,user,commodity,commodity_name,trade_partner')
+        self.assertTrue(lines[1].endswith(',{},{},{},{},{}'.format(
+            inventories[1].pk, self.user.pk, inventories[1].commodity_id, inventories[1].commodity.name,
+            inventories[1].trade_partner_id)))
+
+    def test_history_export_ndjson(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        url = reverse('inventory-detail', args=[inventory.pk])
+        self.client.put(url, data={'type': inventory.type, 'quantity': 5})
+        self.client.delete(url)
+
+        # When
+        url = reverse('inventory-history-export')
+        response = self.client.get(url, {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual([row['action'] for row in rows], ['m', 'd'])
+        self.assertEqual(rows[0]['quantity'], 5)
+        self.assertTrue(rows[0]['created_at'].endswith('Z'))
+
+    def test_history_export_invalid_range(self):
+        # When
+        url = reverse('inventory-history-export')
+        response = self.client.get(url, {
+            'since': '2020-04-02T00:00:00Z',
+            'until': '2020-04-01T00:00:00Z',
+        })
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_history_export_invalid_since_is_json(self):
+        # When
+        url = reverse('inventory-history-export')
+        response = self.client.get(url, {'since': 'yesterday'}, HTTP_ACCEPT='text/csv')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('since', response.json())
+
+    def test_archive_inventory_history_command(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        url = reverse('inventory-detail', args=[inventory.pk])
+        for quantity in range(3):
+            self.client.put(url, data={'type': inventory.type, 'quantity': quantity})
+
+        old_ids = list(InventoryHistory.objects.order_by('id').values_list('id', flat=True)[:2])
+        InventoryHistory.objects.filter(id__in=old_ids).update(created_at=timezone.now() - datetime.timedelta(days=100))
+
+        # When
+        call_command('archive_inventory_history', '--older-than=90', '--batch-size=1', stdout=StringIO())
+
+        # Then
+        self.assertListEqual(list(InventoryHistoryArchive.objects.values_list('id', flat=True)), old_ids)
+        self.assertEqual(InventoryHistoryArchive.objects.get(id=old_ids[0]).inventory, inventory)
+        self.assertEqual(InventoryHistory.objects.count(), 1)
+
+    def test_history_view_reads_archive(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        url = reverse('inventory-detail', args=[inventory.pk])
+        for quantity in range(4):
+            self.client.put(url, data={'type': inventory.type, 'quantity': quantity})
+
+        archived_at = timezone.now() - datetime.timedelta(days=100)
+        old_ids = list(InventoryHistory.objects.order_by('id').values_list('id', flat=True)[:3])
+        InventoryHistory.objects.filter(id__in=old_ids).update(created_at=archived_at)
+        call_command('archive_inventory_history', '--older-than=90', stdout=StringIO())
+
+        # When
+        url = reverse('inventory-history')
+        first = self.client.get(url, {'page_size': 2})
+        second = self.client.get(first['Link'].split(';')[0].strip('<>'))
+
+        # Then
+        self.assertListEqual([data['quantity'] for data in first.data], [0, 1])
+        self.assertListEqual([data['quantity'] for data in second.data], [2, 3])
+
+        # When
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'since': (archived_at + datetime.timedelta(days=1)).isoformat()})
+
+        # Then
+        self.assertListEqual([data['quantity'] for data in response.data], [3])
+        self.assertEqual(sum('FROM "commodities_inventory_history_archive"' in query['sql']
+                             for query in context.captured_queries), 1)
+
+    def test_movements_view(self):
+        # Given
+        partner = baker.make_recipe('apps.commodities.trade_partner')
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        url = reverse('inventory-list')
+
+        response = self.client.post(url, data={
+            'type': Inventory.Type.SHIPPING,
+            'quantity': 5,
+            'commodity': commodity.pk,
+            'trade_partner': partner.pk,
+        })
+        self.client.post(url, data={
+            'type': Inventory.Type.RECEIVING,
+            'quantity': 7,
+            'commodity': commodity.pk,
+            'trade_partner': partner.pk,
+        })
+        detail_url = reverse('inventory-detail', args=[response.data['id']])
+        self.client.put(detail_url, data={'type': Inventory.Type.SHIPPING, 'quantity': 2})
+
+        # When
+        url = reverse('inventory-movements')
+        response = self.client.get(url, {'granularity': 'hour', 'commodity': commodity.pk})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+        data = response.data['results'][0]
+        self.assertEqual(data['commodity_id'], commodity.pk)
+        self.assertEqual(data['trade_partner_id'], partner.pk)
+        self.assertEqual(data['shipped_quantity'], 2)
+        self.assertEqual(data['received_quantity'], 7)
+        self.assertTrue(data['bucket'].endswith(':00:00Z'))
+
+        # When
+        response = self.client.get(url, {'granularity': 'week'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_rollups_command(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        url = reverse('inventory-list')
+        for quantity in (3, 4):
+            self.client.post(url, data={
+                'type': Inventory.Type.SHIPPING,
+                'quantity': quantity,
+                'commodity': commodity.pk,
+            })
+        inventory = Inventory.objects.first()
+        detail_url = reverse('inventory-detail', args=[inventory.pk])
+        self.client.put(detail_url, data={'type': Inventory.Type.RECEIVING, 'quantity': 1})
+
+        expected = list(InventoryMovementRollup.objects.summarize('hour'))
+        InventoryMovementRollup.objects.all().delete()
+
+        # When
+        out = StringIO()
+        call_command('backfill_rollups', stdout=out)
+
+        # Then
+        self.assertListEqual(list(InventoryMovementRollup.objects.summarize('hour')), expected)
+        self.assertIn('skipped 0', out.getvalue())
+
+    def test_backfill_rollups_command_reads_archive(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        self.client.post(reverse('inventory-list'), data={
+            'type': Inventory.Type.SHIPPING,
+            'quantity': 3,
+            'commodity': commodity.pk,
+        })
+        inventory = Inventory.objects.get()
+        InventoryHistory.objects.update(created_at=timezone.now() - datetime.timedelta(days=30))
+        InventoryMovementRollup.objects.all().delete()
+        InventoryMovementRollup.objects.record(
+            added=[inventory], at=timezone.now() - datetime.timedelta(days=30))
+        call_command('archive_inventory_history', '--older-than', '7', stdout=StringIO())
+
+        detail_url = reverse('inventory-detail', args=[inventory.pk])
+        self.client.put(detail_url, data={'type': Inventory.Type.SHIPPING, 'quantity': 5})
+
+        expected = list(InventoryMovementRollup.objects.summarize('day'))
+        InventoryMovementRollup.objects.all().delete()
+
+        # When
+        call_command('backfill_rollups', stdout=StringIO())
+
+        # Then
+        self.assertFalse(InventoryHistory.objects.filter(action=InventoryHistory.Action.ADD).exists())
+        self.assertListEqual(list(InventoryMovementRollup.objects.summarize('day')), expected)
+        self.assertListEqual([row['shipped_quantity'] for row in expected], [3, 2])
+
+    def test_backfill_rollups_command_replays_deleted_inventories(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        response = self.client.post(reverse('inventory-list'), data={
+            'type': Inventory.Type.SHIPPING,
+            'quantity': 7,
+            'commodity': commodity.pk,
+        })
+        detail_url = reverse('inventory-detail', args=[response.data['id']])
+        self.client.put(detail_url, data={'type': Inventory.Type.SHIPPING, 'quantity': 9})
+        self.client.delete(detail_url)
+
+        # Each event an hour apart, with the rollups the live path records.
+        hour = InventoryMovementRollup.objects.get_bucket(timezone.now()) - datetime.timedelta(hours=3)
+        InventoryMovementRollup.objects.all().delete()
+        for offset, (pk, quantity) in enumerate(zip(
+                InventoryHistory.objects.order_by('id').values_list('id', flat=True), (7, 2, -9))):
+            bucket = hour + datetime.timedelta(hours=offset)
+            InventoryHistory.objects.filter(pk=pk).update(created_at=bucket + datetime.timedelta(minutes=5))
+            InventoryMovementRollup.objects.apply(commodity.pk, None, bucket, Inventory.Type.SHIPPING, quantity)
+        expected = list(InventoryMovementRollup.objects.values_list('commodity', 'bucket', 'quantity'))
+
+        # A rollup without history, as an import with --history=none leaves.
+        other = baker.make_recipe('apps.commodities.commodity')
+        InventoryMovementRollup.objects.apply(other.pk, None, hour, Inventory.Type.SHIPPING, 4)
+        InventoryMovementRollup.objects.filter(commodity=commodity).update(quantity=0)
+
+        # When
+        out = StringIO()
+        call_command('backfill_rollups', stdout=out)
+
+        # Then
+        self.assertListEqual(
+            list(InventoryMovementRollup.objects.order_by('bucket', 'commodity')
+                 .values_list('commodity', 'bucket', 'quantity')),
+            expected[:1] + [(other.pk, hour, 4)] + expected[1:])
+        self.assertListEqual([quantity for _, _, quantity in expected], [7, 2, -9])
+        self.assertIn('skipped 0', out.getvalue())
+
+    def test_backfill_rollups_command_keeps_hours_of_batch_imports(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        path = self.write_import_file('.ndjson', json.dumps(
+            {'type': Inventory.Type.SHIPPING, 'quantity': 6, 'commodity': commodity.pk}) + '\n')
+        call_command('import_inventories', path, '--history', 'batch', '--user', self.user.username,
+                     stdout=StringIO())
+        expected = list(InventoryMovementRollup.objects.summarize('hour'))
+
+        # When
+        out = StringIO()
+        call_command('backfill_rollups', stdout=out)
+
+        # Then
+        self.assertListEqual(list(InventoryMovementRollup.objects.summarize('hour')), expected)
+        self.assertEqual(expected[0]['shipped_quantity'], 6)
+        self.assertIn('skipped 1', out.getvalue())
+
+    def write_import_file(self, suffix, text):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'inventories{}'.format(suffix))
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(text)
+        return path
+
+    def test_import_inventories_command(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity', name='Phones')
+        path = self.write_import_file('.csv', (
+            'type,quantity,commodity,trade_partner\n'
+            '1,5,Phones,{}\n'
+            'receiving,7,{},\n'
+        ).format(commodity.trade_partner_id, commodity.pk))
+
+        # When
+        out = StringIO()
+        call_command('import_inventories', path, '--user', self.user.username, '--transaction-size', '1', stdout=out)
+
+        # Then
+        inventories = list(Inventory.objects.values_list('type', 'quantity', 'commodity', 'trade_partner'))
+        self.assertListEqual(inventories, [
+            (Inventory.Type.SHIPPING, 5, commodity.pk, commodity.trade_partner_id),
+            (Inventory.Type.RECEIVING, 7, commodity.pk, None),
+        ])
+        summary = CommodityStockSummary.objects.get(commodity=commodity)
+        self.assertEqual(summary.total_quantity, 12)
+        self.assertEqual(
+            sum(row['shipped_quantity'] + row['received_quantity']
+                for row in InventoryMovementRollup.objects.summarize('hour')), 12)
+        self.assertListEqual(
+            list(InventoryHistory.objects.values_list('inventory', flat=True)),
+            list(Inventory.objects.values_list('id', flat=True)))
+        self.assertIn('Imported 2 rows', out.getvalue())
+
+    def test_import_inventories_command_resumes_from_checkpoint(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        path = self.write_import_file('.ndjson', ''.join(
+            json.dumps({'type': 1, 'quantity': quantity, 'commodity': commodity.pk}) + '\n'
+            for quantity in range(3)))
+        InventoryImportCheckpoint.objects.create(name='warehouse', path=path, rows=2)
+
+        # When
+        call_command('import_inventories', path, '--history', 'batch', '--user', self.user.username,
+                     '--checkpoint', 'warehouse', stdout=StringIO())
+
+        # Then
+        self.assertListEqual(list(Inventory.objects.values_list('quantity', flat=True)), [2])
+        history = InventoryHistory.objects.get()
+        self.assertIsNone(history.inventory)
+        self.assertTrue(history.detail.startswith('1 inventories imported from inventories.ndjson'))
+        self.assertEqual(InventoryImportCheckpoint.objects.get(name='warehouse').rows, 3)
+
+    def test_import_inventories_command_checkpoint_rolls_back_with_rows(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        path = self.write_import_file('.ndjson', ''.join(
+            json.dumps({'type': 1, 'quantity': quantity, 'commodity': commodity.pk}) + '\n'
+            for quantity in range(3)))
+        add_inventories = CommodityStockSummary.objects.add_inventories
+
+        def fail_on_second_chunk(inventories):
+            if Inventory.objects.count() > 1:
+                raise RuntimeError('interrupted')
+            add_inventories(inventories)
+
+        # When
+        with mock.patch.object(CommodityStockSummary.objects, 'add_inventories', side_effect=fail_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('import_inventories', path, '--history', 'none', '--transaction-size', '1',
+                             '--checkpoint', 'warehouse', stdout=StringIO())
+
+        # Then
+        self.assertListEqual(list(Inventory.objects.values_list('quantity', flat=True)), [0])
+        self.assertEqual(InventoryImportCheckpoint.objects.get(name='warehouse').rows, 1)
+
+        # When
+        call_command('import_inventories', path, '--history', 'none', '--checkpoint', 'warehouse',
+                     stdout=StringIO())
+
+        # Then
+        self.assertListEqual(list(Inventory.objects.values_list('quantity', flat=True)), [0, 1, 2])
+
+    def test_import_inventories_command_invalid_row(self):
+        # Given
+        baker.make_recipe('apps.commodities.commodity', name='Phones', _quantity=2)
+        path = self.write_import_file('.csv', 'type,quantity,commodity\n1,5,Phones\n')
+
+        # When, Then
+        with self.assertRaisesMessage(CommandError, 'line 2: commodity \'Phones\' is ambiguous'):
+            call_command('import_inventories', path, '--history', 'none', stdout=StringIO())
+        self.assertFalse(Inventory.objects.exists())
+
+    def assert_inventory_history_match(self, history, action, user):
+        self.assertEqual(history.action, action)
+        self.assertEqual(history.user, user)
+
+class SparseFieldsetTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+        baker.make_recipe('apps.commodities.inventory', _quantity=3)
+
+    def setUp(self):
+        super().setUp()
+
+        self.client.force_authenticate(user=self.user)
+
+    def test_fields(self):
+        # When
+        url = reverse('inventory-list')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'fields': 'id,quantity'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for data in response.data['results']:
+            self.assertListEqual(list(data.keys()), ['id', 'quantity'])
+
+        sql = context.captured_queries[-1]['sql']
+        self.assertNotIn('"type"', sql)
+        self.assertNotIn('commodities_commodity', sql)
+
+    def test_omit(self):
+        # Given
+        inventory = Inventory.objects.first()
+        url = reverse('inventory-detail', args=[inventory.pk])
+        self.client.put(url, data={'type': inventory.type, 'quantity': 1})
+
+        # When
+        url = reverse('inventory-history')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'omit': 'detail'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('detail', response.data[0])
+        self.assertNotIn('"detail"', context.captured_queries[-1]['sql'])
+
+    def test_compact(self):
+        # When
+        url = reverse('inventory-list')
+        response = self.client.get(url, {'fields': 'id,commodity_name', 'compact': '1'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+
+        results = response.data['results']
+        self.assertListEqual(results['fields'], ['id', 'commodity_name'])
+        self.assertListEqual(
+            results['rows'],
+            [[inventory.pk, inventory.commodity.name] for inventory in Inventory.objects.select_related('commodity')])
+
+    def test_unknown_field(self):
+        # When
+        url = reverse('inventory-list')
+        response = self.client.get(url, {'fields': 'id,password'})
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+class ValuesSerializerTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        partner = baker.make_recipe('apps.commodities.trade_partner')
+        commodity = baker.make_recipe('apps.commodities.commodity', name='Tea "Oolong" \u00e9', trade_partner=partner)
+        baker.make_recipe('apps.commodities.inventory', commodity=commodity, type=Inventory.Type.SHIPPING)
+        baker.make_recipe('apps.commodities.inventory', commodity=commodity, type=Inventory.Type.RECEIVING)
+        baker.make_recipe('apps.commodities.inventory', _quantity=2)
+        CommodityStockSummary.objects.rebuild()
+
+    def assert_same_json(self, serializer_class, queryset):
+        names = list(serializer_class().fields)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+        rows = queryset.values(*serializer_class.get_value_sources(names))
+        actual = JSONRenderer().render(serializer_class.represent_values(rows, names))
+
+        self.assertEqual(actual, expected)
+
+    def test_inventory_list(self):
+        self.assert_same_json(serializers.InventoryListSerializer, Inventory.objects.select_related('commodity'))
+
+    def test_commodity_list(self):
+        self.assert_same_json(serializers.CommodityListSerializer, Commodity.objects.all())
+
+    def test_trade_partner_list(self):
+        self.assert_same_json(serializers.TradePartnerListSerializer, TradePartner.objects.all())
+
+    def test_inventory_trade_partner_summary(self):
+        baker.make_recipe('apps.commodities.inventory', trade_partner=None)
+        serializer_class = serializers.InventoryTradePartnerSummarySerializer
+        names = list(serializer_class().fields)
+        queryset = Inventory.objects.summarize('trade_partner')
+
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        actual = JSONRenderer().render(serializer_class.represent_values(queryset, names))
+
+        self.assertEqual(actual, expected)
+        self.assertIn(b'"trade_partner_id":null', actual)
+
+    def test_inventory_summary(self):
+        names = list(serializers.InventorySummarySerializer().fields)
+        queryset = CommodityStockSummary.objects.summarize()
+
+        expected = JSONRenderer().render(serializers.InventorySummarySerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(serializers.InventorySummarySerializer.represent_values(queryset, names))
+
+        self.assertEqual(actual, expected)
+
+class QueryCountTestCase(APITestCase):
+    """
+    Every endpoint must issue the same number of queries whatever the page
+    size, i.e. nothing is fetched per row.
+    """
+    row_count = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+
+        partners = baker.make_recipe('apps.commodities.trade_partner', _quantity=cls.row_count)
+        commodities = [
+            baker.make_recipe('apps.commodities.commodity', trade_partner=partner)
+            for partner in partners
+        ]
+        cls.inventories = [
+            baker.make_recipe('apps.commodities.inventory', commodity=commodity, trade_partner=commodity.trade_partner)
+            for commodity in commodities
+        ]
+        for inventory in cls.inventories:
+            baker.make(InventoryHistory, inventory=inventory, user=cls.user, type=inventory.type, quantity=1)
+        CommodityStockSummary.objects.rebuild()
+
+    def setUp(self):
+        super().setUp()
+
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def count_queries(self, url, params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url, size_param):
+        small = self.count_queries(url, {size_param: 1})
+        large = self.count_queries(url, {size_param: self.row_count})
+        self.assertEqual(small, large)
+
+    def test_inventory_list(self):
+        self.assert_constant_queries(reverse('inventory-list'), 'limit')
+
+    def test_inventory_summary(self):
+        self.assert_constant_queries(reverse('inventory-summary'), 'limit')
+
+    def test_inventory_history(self):
+        self.assert_constant_queries(reverse('inventory-history'), 'page_size')
+
+    def test_trade_partner_list(self):
+        self.assert_constant_queries('/api/trade-partners/', 'page_size')
+
+    def test_commodity_list(self):
+        self.assert_constant_queries('/api/commodities/', 'limit')
+
+    def count_bulk_create_queries(self, size):
+        inventory = self.inventories[0]
+        data = [
+            {'type': inventory.type, 'quantity': 1, 'commodity': inventory.commodity_id,
+             'trade_partner': inventory.trade_partner_id}
+            for _ in range(size)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('inventory-bulk'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return len(context.captured_queries)
+
+    def test_inventory_bulk_create(self):
+        # The first batch creates this hour's rollup.
+        self.count_bulk_create_queries(1)
+        self.assertEqual(self.count_bulk_create_queries(1), self.count_bulk_create_queries(self.row_count))
+
+    def test_inventory_retrieve(self):
+        # Given
+        url = reverse('inventory-detail', args=[self.inventories[0].pk])
+
+        # Then
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+class ListAllGluttedCommodityTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.dhl, cls.ups = baker.make_recipe('apps.commodities.trade_partner', _quantity=2)
+        cls.computers = baker.make_recipe('apps.commodities.commodity', name='Computers', trade_partner=cls.dhl)
+        cls.phones = baker.make_recipe('apps.commodities.commodity', name='Phones', trade_partner=cls.ups)
+        cls.cables = baker.make_recipe('apps.commodities.commodity', name='Cables', trade_partner=cls.ups)
+
+        baker.make_recipe('apps.commodities.inventory', quantity=150, commodity=cls.computers)
+        baker.make_recipe('apps.commodities.inventory', quantity=300, commodity=cls.phones)
+        baker.make_recipe('apps.commodities.inventory', quantity=50, commodity=cls.cables)
+        CommodityStockSummary.objects.rebuild()
+
+    def run_command(self, **options):
+        stdout = StringIO()
+        call_command('list_all_glutted_commodity', stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_json_format(self):
+        # When
+        output = self.run_command(format='json')
+
+        # Then
+        self.assertListEqual(json.loads(output), [
+            {'id': self.phones.pk, 'Name': 'Phones', 'Quantity': 300},
+            {'id': self.computers.pk, 'Name': 'Computers', 'Quantity': 150},
+        ])
+
+    def test_csv_format_with_limit(self):
+        # When
+        output = self.run_command(format='csv', limit=1)
+
+        # Then
+        self.assertListEqual(output.splitlines(), [
+            'id,Name,Quantity',
+            '{},Phones,300'.format(self.phones.pk),
+        ])
+
+    def test_commodity_trade_partner(self):
+        # Given
+        baker.make_recipe('apps.commodities.inventory', quantity=20, commodity=self.phones, trade_partner=self.dhl)
+
+        for source in ('inventory', 'summary'):
+            # When
+            output = self.run_command(format='json', source=source, commodity_trade_partner=self.dhl.pk,
+                                      quantity=10)
+
+            # Then
+            self.assertListEqual(json.loads(output), [
+                {'id': self.computers.pk, 'Name': 'Computers', 'Quantity': 150},
+            ], source)
+
+    def test_table_format(self):
+        # When
+        output = self.run_command(quantity=200)
+
+        # Then
+        self.assertIn('Phones', output)
+        self.assertNotIn('Computers', output)
+
+    def test_negative_quantity(self):
+        with self.assertRaises(CommandError):
+            self.run_command(quantity=-1)
+
+class BufferedAuditSinkTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+        cls.inventory = baker.make_recipe('apps.commodities.inventory')
+
+    def make_log(self, inventory=None):
+        inventory = inventory or self.inventory
+        return signals.make_inventory_save_log(inventory, self.user, False)
+
+    def test_flush_when_batch_is_full(self):
+        # Given
+        sink = audit.BufferedAuditSink(flush_size=2, flush_interval=None)
+
+        # When
+        sink.enqueue([self.make_log()])
+
+        # Then
+        self.assertEqual(InventoryHistory.objects.count(), 0)
+
+        # When
+        sink.enqueue([self.make_log()])
+
+        # Then
+        self.assertEqual(InventoryHistory.objects.count(), 2)
+        self.assertListEqual(sink.pending, [])
+
+    def test_close_flushes_pending_rows(self):
+        # Given
+        sink = audit.BufferedAuditSink(flush_size=10, flush_interval=None)
+        sink.enqueue([self.make_log(), self.make_log()])
+
+        # When
+        sink.close()
+
+        # Then
+        self.assertEqual(InventoryHistory.objects.filter(inventory=self.inventory).count(), 2)
+
+    def test_created_at_is_event_time(self):
+        # Given
+        sink = audit.BufferedAuditSink(flush_size=10, flush_interval=None)
+        log = self.make_log()
+        expected = log.created_at
+
+        # When
+        sink.enqueue([log])
+        sink.flush()
+
+        # Then
+        self.assertEqual(InventoryHistory.objects.get().created_at, expected)
+
+    def test_deleted_inventory_is_detached(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        sink = audit.BufferedAuditSink(flush_size=10, flush_interval=None)
+        sink.enqueue([self.make_log(inventory)])
+        inventory.delete()
+
+        # When
+        sink.flush()
+
+        # Then
+        history = InventoryHistory.objects.get()
+        self.assertIsNone(history.inventory)
+        self.assertEqual(history.user, self.user)
+
+    def test_full_batch_is_flushed_by_worker(self):
+        # Given
+        sink = audit.BufferedAuditSink(flush_size=1, flush_interval=60)
+        self.addCleanup(sink.close)
+        written = threading.Event()
+        threads = []
+
+        def write(logs):
+            threads.append(threading.current_thread().name)
+            written.set()
+
+        # When
+        with mock.patch.object(sink, 'write', side_effect=write):
+            sink.enqueue([self.make_log()])
+
+            # Then
+            self.assertTrue(written.wait(5))
+        self.assertListEqual(threads, ['audit-sink'])
+
+    def test_reset_flushes_previous_sink(self):
+        # Given
+        config = {
+            'SINK': 'apps.commodities.audit.BufferedAuditSink',
+            'OPTIONS': {'flush_size': 10, 'flush_interval': None},
+        }
+
+        # When
+        with override_settings(INVENTORY_AUDIT=config):
+            audit.get_sink().enqueue([self.make_log()])
+            self.assertEqual(InventoryHistory.objects.count(), 0)
+
+        # Then
+        self.assertEqual(InventoryHistory.objects.count(), 1)
+
+@override_settings(INSTRUMENTATION={'SAMPLE_RATE': 1.0})
+class InstrumentationMiddlewareTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+
+    def setUp(self):
+        super().setUp()
+
+        cache.clear()
+        instrumentation.REGISTRY.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_header(self):
+        # Given
+        baker.make_recipe('apps.commodities.inventory', _quantity=2)
+
+        # When
+        response = self.client.get(reverse('inventory-list'))
+
+        # Then
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertListEqual(metrics, ['db', 'app', 'render', 'total'])
+        self.assertIn('db;desc="2 queries"', response['Server-Timing'])
+
+    def test_metrics_view(self):
+        # Given
+        self.client.get(reverse('inventory-list'))
+
+        # When
+        response = self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1')
+        content = response.content.decode('utf-8')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('freight_queries_count{endpoint="GET inventory-list"} 1', content)
+        self.assertIn('freight_request_seconds_bucket{endpoint="GET inventory-list",le="+Inf"} 1', content)
+
+    def test_metrics_view_is_internal(self):
+        # When
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(INSTRUMENTATION={'SAMPLE_RATE': 0})
+    def test_unsampled_request(self):
+        # When
+        response = self.client.get(reverse('inventory-list'))
+
+        # Then
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(instrumentation.REGISTRY.render().count('_count'), 0)
+
+class DatabaseProfileTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        connection.ensure_connection()
+        self.settings_dict = dict(connection.settings_dict)
+
+    def tearDown(self):
+        connection.settings_dict.clear()
+        connection.settings_dict.update(self.settings_dict)
+        super().tearDown()
+
+    def test_unusable_connection_is_closed_on_request_started(self):
+        # Given
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = True
+
+        # When
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            database.check_connections()
+
+        # Then
+        close.assert_called_once_with()
+
+    def test_usable_connection_is_kept(self):
+        # Given
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = True
+
+        # When
+        with mock.patch.object(connection, 'close') as close:
+            database.check_connections()
+
+        # Then
+        close.assert_not_called()
+
+    @skipUnless(connection.vendor == 'sqlite', 'pragmas are SQLite specific')
+    def test_sqlite_pragmas_on_connection_created(self):
+        # Given
+        connection.settings_dict['SYNCHRONOUS'] = 'normal'
+
+        # When
+        database.configure_connection(sender=connection.__class__, connection=connection)
+
+        # Then
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+class ReadPoolASGIHandlerTestCase(APISimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.factory = APIRequestFactory()
+        cls.handler = ReadPoolASGIHandler()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.handler.executor.shutdown()
+        super().tearDownClass()
+
+    def test_read_endpoints_use_pool(self):
+        for url in ['/api/inventories/', '/api/inventories/summary/', '/api/inventories/history/',
+                    '/api/commodities/', '/api/commodities/1/']:
+            self.assertTrue(self.handler.is_read_request(self.factory.get(url)), url)
+
+    def test_other_requests_keep_default_path(self):
+        self.assertFalse(self.handler.is_read_request(self.factory.post('/api/inventories/')))
+        self.assertFalse(self.handler.is_read_request(self.factory.get('/api/inventories/1/')))
+        self.assertFalse(self.handler.is_read_request(self.factory.get('/api/unknown/')))
+
+class ReadPoolASGIStreamingTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.handler = ReadPoolASGIHandler()
+        self.addCleanup(self.handler.executor.shutdown)
+        self.token = Token.objects.create(user=baker.make_recipe('apps.users.user')).key
+
+    def asgi_get(self, path, query_string=b''):
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query_string,
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', 'Token {}'.format(self.token).encode('ascii')),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.handler(scope, receive, send))
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+    def test_history_export(self):
+        # Given
+        inventory = baker.make_recipe('apps.commodities.inventory')
+        InventoryHistory.objects.bulk_create([
+            InventoryHistory(action=InventoryHistory.Action.MODIFY, type=inventory.type, quantity=quantity,
+                             inventory=inventory)
+            for quantity in range(5)
+        ])
+
+        # When
+        with mock.patch.object(InventoryViewSet, 'export_chunk_size', 2):
+            status_code, body = self.asgi_get('/api/inventories/history/export/', b'format=csv')
+
+        # Then
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        lines = body.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertListEqual([line.split(',')[4] for line in lines[1:]], ['0', '1', '2', '3', '4'])
+
+class ResponseCacheTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+
+    def setUp(self):
+        super().setUp()
+
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_is_served_from_cache(self):
+        # Given
+        baker.make_recipe('apps.commodities.trade_partner', _quantity=2)
+        url = '/api/trade-partners/'
+        expected = self.client.get(url)
+
+        # When
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, expected.data)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_if_none_match_returns_not_modified(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        url = '/api/commodities/{}/'.format(commodity.pk)
+        etag = self.client.get(url)['ETag']
+
+        # When
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_update_invalidates_cache(self):
+        # Given
+        partner = baker.make_recipe('apps.commodities.trade_partner')
+        url = '/api/trade-partners/{}/'.format(partner.pk)
+        etag = self.client.get(url)['ETag']
+        self.client.get('/api/trade-partners/')
+
+        # When
+        self.client.put(url, data={'name': 'UPS'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'UPS')
+        self.assertEqual(self.client.get('/api/trade-partners/').data[0]['name'], 'UPS')
+
+    def test_trade_partner_delete_invalidates_commodities(self):
+        # Given
+        commodity = baker.make_recipe('apps.commodities.commodity')
+        url = '/api/commodities/{}/'.format(commodity.pk)
+        self.client.get(url)
+
+        # When
+        self.client.delete('/api/trade-partners/{}/'.format(commodity.trade_partner_id))
+        response = self.client.get(url)
+
+        # Then
+        self.assertIsNone(response.data['trade_partner'])
+
+class LinkHeaderPaginationTestCase(APISimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.factory = APIRequestFactory()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test_get_link(self):
+        # Given
+        url, page, size, rel = '/api/pages/', 0, 30, 'next'
+        request = self.factory.get(url)
+        queryset = [1]
+        expected = '<http://testserver{}?page={}&page_size={}>; rel="{}"'.format(
+            url, page, size, rel)
+
+        # When
+        paginator = LinkHeaderPagination()
+        paginator.paginate_queryset(queryset, request)
+        link = paginator.get_link(page, size, rel)
+
+        # Then
+        self.assertEqual(link, expected)
+
+    def test_paginate_queryset_empty_page(self):
+        # Given
+        page, page_size, url = 2, api_settings.PAGE_SIZE, '/api/pages/'
+        request = self.factory.get(url, {'page': page})
+        queryset = [1]
+
+        # When
+        with self.assertRaises(Http404):
+            paginator = LinkHeaderPagination()
+            paginator.paginate_queryset(queryset, request)
+
+    def test_get_paginated_response_first_page(self):
+        # Given
+        page_size, url = api_settings.PAGE_SIZE, '/api/pages/'
+        request = self.factory.get(url)
+        queryset = list(range(page_size + 1))
+        expected = queryset[:page_size]
+
+        # When
+        paginator = LinkHeaderPagination()
+        data = paginator.paginate_queryset(queryset, request)
+        response = paginator.get_paginated_response(data)
+
+        # Then
+        self.assertListEqual(response.data, expected)
+        self.assertIn('rel=\"next\"', response['Link'])
+        self.assertIn('rel=\"last\"', response['Link'])
+        self.assertNotIn('rel=\"first\"', response['Link'])
+        self.assertNotIn('rel=\"prev\"', response['Link'])
+
+    def test_get_paginated_response_middle_page(self):
+        # Given
+        page, page_size, url = 2, 5, '/api/pages/'
+        request = self.factory.get(url, {'page': page, 'page_size': page_size})
+        queryset = list(range(page_size * 3))
+        expected = queryset[page_size:page_size+page_size]
+
+        # When
+        paginator = LinkHeaderPagination()
+        data = paginator.paginate_queryset(queryset, request)
+        response = paginator.get_paginated_response(data)
+
+        # Then
+        self.assertListEqual(response.data, expected)
+        self.assertIn('rel=\"next\"', response['Link'])
+        self.assertIn('rel=\"last\"', response['Link'])
+        self.assertIn('rel=\"first\"', response['Link'])
+        self.assertIn('rel=\"prev\"', response['Link'])
+
+    def test_get_paginated_response_last_page(self):
+        # Given
+        page, page_size, url = 2, api_settings.PAGE_SIZE, '/api/pages/'
+        request = self.factory.get(url, {'page': page})
+        queryset = list(range(page_size + 1))
+        expected = queryset[page_size:]
+
+        # When
+        paginator = LinkHeaderPagination()
+        data = paginator.paginate_queryset(queryset, request)
+        response = paginator.get_paginated_response(data)
+
+        # Then
+        self.assertListEqual(response.data, expected)
+        self.assertNotIn('rel=\"next\"', response['Link'])
+        self.assertNotIn('rel=\"last\"', response['Link'])
+        self.assertIn('rel=\"first\"', response['Link'])
+        self.assertIn('rel=\"prev\"', response['Link'])
+
+class CachedCountLimitOffsetPaginationTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+        baker.make_recipe('apps.commodities.inventory', _quantity=3)
+
+    def setUp(self):
+        super().setUp()
+
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_count_is_cached(self):
+        # Given
+        url = reverse('inventory-list')
+        self.client.get(url, {'limit': 2})
+        baker.make_recipe('apps.commodities.inventory')
+
+        # When
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'limit': 2})
+
+        # Then
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['count_exact'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('offset=2', response.data['next'])
+
+    def test_last_page_corrects_cached_count(self):
+        # Given
+        url = reverse('inventory-summary')
+        CommodityStockSummary.objects.rebuild()
+        self.client.get(url, {'limit': 10})
+        Inventory.objects.all().delete()
+        CommodityStockSummary.objects.rebuild()
+
+        # When
+        response = self.client.get(url, {'limit': 10})
+
+        # Then
+        self.assertEqual(response.data['count'], 0)
+        self.assertTrue(response.data['count_exact'])
+        self.assertListEqual(response.data['results'], [])
+
+    def test_stale_cached_count_is_not_exact(self):
+        # Given
+        url = reverse('inventory-list')
+        self.client.get(url, {'limit': 1})
+        Inventory.objects.filter(pk=Inventory.objects.first().pk).delete()
+
+        # When
+        response = self.client.get(url, {'limit': 1})
+
+        # Then
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['count_exact'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_estimated_count(self):
+        # Given
+        url = reverse('inventory-list')
+
+        # When
+        with mock.patch.object(CachedCountLimitOffsetPagination, 'estimate_count', return_value=(5000000, False)):
+            response = self.client.get(url, {'limit': 2})
+
+        # Then
+        self.assertEqual(response.data['count'], 5000000)
+        self.assertFalse(response.data['count_exact'])
+        self.assertIn('offset=2', response.data['next'])
+
+class CursorLinkHeaderPaginationTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.factory = APIRequestFactory()
+        cls.partners = baker.make_recipe('apps.commodities.trade_partner', _quantity=7)
+
+    def paginate(self, url, data=None):
+        request = self.factory.get(url, data)
+        paginator = CursorLinkHeaderPagination()
+        data = paginator.paginate_queryset(TradePartner.objects.all(), request)
+        response = paginator.get_paginated_response(data)
+        links = {}
+        for link in filter(None, response['Link'].split(', ')):
+            uri, rel = link.split('; ')
+            links[rel[5:-1]] = uri[1:-1]
+        return [partner.pk for partner in data], links
+
+    def test_first_page(self):
+        # When
+        with self.assertNumQueries(1):
+            pks, links = self.paginate('/api/pages/', {'page_size': 3})
+
+        # Then
+        self.assertListEqual(pks, [p.pk for p in self.partners[:3]])
+        self.assertCountEqual(links.keys(), ['next', 'last'])
+
+    def test_follow_next_and_prev_links(self):
+        # When
+        _, links = self.paginate('/api/pages/', {'page_size': 3})
+        pks, links = self.paginate(links['next'])
+
+        # Then
+        self.assertListEqual(pks, [p.pk for p in self.partners[3:6]])
+        self.assertCountEqual(links.keys(), ['next', 'last', 'first', 'prev'])
+
+        # When
+        pks, links = self.paginate(links['prev'])
+
+        # Then
+        self.assertListEqual(pks, [p.pk for p in self.partners[:3]])
+        self.assertCountEqual(links.keys(), ['next', 'last'])
+
+    def test_last_page(self):
+        # When
+        _, links = self.paginate('/api/pages/', {'page_size': 3})
+        pks, links = self.paginate(links['last'])
+
+        # Then
+        self.assertListEqual(pks, [p.pk for p in self.partners[4:]])
+        self.assertCountEqual(links.keys(), ['first', 'prev'])
+
+    def test_descending_ordering(self):
+        # Given
+        request = self.factory.get('/api/pages/', {'page_size': 3})
+
+        # When
+        paginator = CursorLinkHeaderPagination()
+        data = paginator.paginate_queryset(TradePartner.objects.order_by('-id'), request)
+
+        # Then
+        self.assertListEqual([p.pk for p in data], [p.pk for p in self.partners[::-1][:3]])
+        self.assertListEqual(paginator.ordering, ['-id'])
+
+    def test_invalid_cursor(self):
+        # Given
+        request = self.factory.get('/api/pages/', {'cursor': 'garbage'})
+
+        # When
+        with self.assertRaises(Http404):
+            paginator = CursorLinkHeaderPagination()
+            paginator.paginate_queryset(TradePartner.objects.all(), request)
+
+    def test_tampered_cursor(self):
+        self.client.force_authenticate(user=baker.make_recipe('apps.users.user'))
+        for position in (['abc'], {'a': 1}, [None], [[1]]):
+            # Given
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position, 'r': 0}).encode('utf-8')).decode('ascii')
+
+            # When
+            response = self.client.get('/api/trade-partners/', {'cursor': cursor})
+
+            # Then
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked against SQLite')
+class InventoryHistoryQueryPlanTestCase(TestCase):
+
+    def test_inventory_range_uses_inventory_created_at_index(self):
+        # Given
+        queryset = InventoryHistory.objects.for_inventory(1) \
+            .created_since('2020-01-01T00:00:00Z') \
+            .order_by('-created_at', '-id')
+
+        # When
+        plan = queryset.explain()
+
+        # Then
+        self.assertIn('USING INDEX commodities_invento_c22deb_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_time_range_uses_created_at_index(self):
+        # Given
+        queryset = InventoryHistory.objects.created_since('2020-01-01T00:00:00Z') \
+            .created_until('2020-02-01T00:00:00Z') \
+            .order_by('created_at', 'id')
+
+        # When
+        plan = queryset.explain()
+
+        # Then
+        self.assertIn('USING INDEX commodities_created_ca1fa1_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_commodity_range_uses_commodity_created_at_index(self):
+        # Given
+        queryset = InventoryHistory.objects.for_commodity(1) \
+            .created_since('2020-01-01T00:00:00Z') \
+            .order_by('created_at', 'id')
+
+        # When
+        plan = queryset.explain()
+
+        # Then
+        self.assertIn('USING INDEX commodities_commodi_6cff8b_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked against SQLite')
+class InventoryQueryPlanTestCase(TestCase):
+
+    def test_summarize_uses_covering_index(self):
+        # When
+        plan = Inventory.objects.summarize().explain()
+
+        # Then
+        self.assertIn('USING COVERING INDEX commodities_commodi_77029c_idx', plan)
+
+    def test_explain_inventory_queries_command(self):
+        # When
+        out = StringIO()
+        call_command('explain_inventory_queries', '--fail-on-scan', stdout=out)
+
+        # Then
+        self.assertIn('Inventory.objects.summarize()', out.getvalue())
+
+    def test_explain_inventory_queries_command_fails_on_scan(self):
+        # Given
+        queries = [('Inventory.objects.shipping()', Inventory.objects.shipping(), False)]
+
+        # When, Then
+        with mock.patch.object(explain_inventory_queries.Command, 'get_queries', return_value=queries):
+            with self.assertRaises(CommandError):
+                call_command('explain_inventory_queries', '--fail-on-scan', stdout=StringIO())
+
+    def test_full_scan_pattern_sqlite(self):
+        # Given
+        pattern = explain_inventory_queries.FULL_SCAN_PATTERNS['sqlite']
+        plans = {
+            '8 0 0 SCAN commodities_inventory USING INDEX commodities_inventory_trade_partner_id_ce7e6fd1':
+                ['commodities_inventory'],
+            '3 0 0 SCAN TABLE commodities_inventory': ['commodities_inventory'],
+            '7 0 0 SCAN commodities_inventory USING COVERING INDEX commodities_commodi_77029c_idx': [],
+            '9 0 0 SEARCH commodities_commodity USING INTEGER PRIMARY KEY (rowid=?)': [],
+        }
+
+        for plan, tables in plans.items():
+            # When
+            scans = [match.group('table') for match in pattern.finditer(plan)]
+
+            # Then
+            self.assertEqual(scans, tables, plan)
+
+class FastJSONRendererTestCase(APISimpleTestCase):
+
+    data = {
+        'created_at': datetime.datetime(2020, 4, 1, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(2020, 4, 1),
+        'price': decimal.Decimal('1.50'),
+        'name': 'Tea \u00e9 \u2028',
+        'type': Inventory.Type.SHIPPING,
+        'rows': [[1, None, True, 0.1]],
+        1: 'key',
+    }
+
+    def test_matches_json_renderer(self):
+        # When
+        expected = JSONRenderer().render(self.data)
+        actual = renderers.FastJSONRenderer().render(self.data)
+
+        # Then
+        self.assertEqual(actual, expected)
+
+    def test_without_orjson(self):
+        # When
+        with mock.patch.object(renderers, 'orjson', None):
+            actual = renderers.FastJSONRenderer().render(self.data)
+
+        # Then
+        self.assertEqual(actual, JSONRenderer().render(self.data))
+
+    def test_indent(self):
+        # When
+        actual = renderers.FastJSONRenderer().render(self.data, 'application/json; indent=2')
+
+        # Then
+        self.assertEqual(actual, JSONRenderer().render(self.data, 'application/json; indent=2'))
+
+    def test_parse(self):
+        # Given
+        parser = renderers.FastJSONParser()
+
+        # When
+        data = parser.parse(BytesIO('{"quantity": 1, "name": "\u00e9"}'.encode('utf-8')))
+
+        # Then
+        self.assertDictEqual(data, {'quantity': 1, 'name': '\u00e9'})
+
+        # When, Then
+        self.assertRaises(ParseError, parser.parse, BytesIO(b'{"quantity": '))
@@ -1,28 +1,57 @@
 from django.shortcuts import render
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.paginator import Paginator, EmptyPage
-from django.db import transaction
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
 
 from rest_framework import mixins
 from rest_framework import generics
 from rest_framework import views
 from rest_framework import viewsets
 from rest_framework import status
+from rest_framework import exceptions
 from rest_framework import pagination
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.decorators import action
-from rest_framework.utils.urls import replace_query_param
+from rest_framework.utils import encoders
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
+from apps.commodities import audit
+from apps.commodities import cache
+from apps.commodities import fieldsets
+from apps.commodities import renderers
 from apps.commodities import serializers
 from apps.commodities import signals
-from apps.commodities.models import TradePartner, Commodity, Inventory, InventoryHistory
-
+from apps.commodities.models import TradePartner, Commodity, Inventory, InventoryHistory, InventoryHistoryArchive, \
+    CommodityStockSummary, InventoryMovementRollup
+
+import base64
+import binascii
+import copy
+import functools
+import itertools
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# Exceptions
+class PreconditionFailed(exceptions.APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified since it was fetched.'
+    default_code = 'precondition_failed'
+
+class Conflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The request conflicts with the current state of the resource.'
+    default_code = 'conflict'
+
+
 # Pagination
 class LinkHeaderPagination(pagination.BasePagination):
     page_size = api_settings.PAGE_SIZE
@@ -94,16 +123,209 @@ class LinkHeaderPagination(pagination.BasePagination):
         replaced_uri = replace_query_param(replaced_uri, self.page_size_query_param, size)
         return '<{}>; rel="{}"'.format(replaced_uri, rel)
 
+def get_keyset_filter(ordering, position):
+    """
+    Condition selecting the rows after `position`, the values of the
+    `ordering` columns of the last row read.
+    """
+    keyset = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = '{}__{}'.format(name, 'lt' if field.startswith('-') else 'gt')
+        condition = Q(**{lookup: position[i]})
+        for prev_field, value in zip(ordering[:i], position[:i]):
+            condition &= Q(**{prev_field.lstrip('-'): value})
+        keyset |= condition
+    return keyset
+
+class CursorLinkHeaderPagination(LinkHeaderPagination):
+    """
+    Keyset flavour of LinkHeaderPagination.
+
+    Pages are addressed by an opaque cursor holding the ordering values of the
+    row at the page boundary, so neither COUNT(*) nor OFFSET is ever issued.
+    The queryset ordering is used when given, otherwise `ordering`; the
+    primary key is appended as a tie-breaker.
+
+    A list of querysets over the same columns, such as the hot and archived
+    tiers of a table, is paged as one: each is read up to a page and the
+    rows are merged.
+    """
+    cursor_query_param = 'cursor'
+    ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(querysets[0])
+
+        position, reverse = self.decode_cursor(request, querysets[0].model)
+
+        ordering = self.ordering if not reverse else [self._reverse_field(f) for f in self.ordering]
+        results = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*ordering)
+            if position is not None:
+                queryset = queryset.filter(get_keyset_filter(ordering, position))
+            results.extend(queryset[:self.page_size + 1])
+
+        if len(querysets) > 1:
+            results.sort(key=functools.cmp_to_key(lambda a, b: self._compare(ordering, a, b)))
+
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size or 30
+        if page_size < 1:
+            raise Http404
+        return page_size
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or self.ordering)
+        if not any(f.lstrip('-') in ('id', 'pk') for f in ordering):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return ordering
+
+    def decode_cursor(self, request, model):
+        cursor = request.GET.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if position is not None:
+                position = self._parse_position(model, position)
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise Http404
+
+        return position, reverse
+
+    def _parse_position(self, model, position):
+        # The position comes back from the client, so each value is checked
+        # against its column before a filter is built on it.
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise ValueError
+
+        values = []
+        for field, value in zip(self.ordering, position):
+            if value is None or isinstance(value, (list, dict)):
+                raise ValueError
+
+            name = field.lstrip('-')
+            try:
+                model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # An annotation; the database compares it as given.
+                values.append(value)
+                continue
+
+            if isinstance(model_field, models.DateTimeField):
+                # Cursors carry full ISO 8601 timestamps, as encoded.
+                value = parse_datetime(value) if isinstance(value, str) else None
+                if value is None:
+                    raise ValueError
+                values.append(value)
+            else:
+                values.append(model_field.to_python(value))
+        return values
+
+    def encode_cursor(self, position, reverse):
+        cursor = json.dumps({'p': position, 'r': int(reverse)}, cls=encoders.JSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        cursor = self.encode_cursor(self._get_position(self.page[-1]), False)
+        return self.get_cursor_link(cursor, 'next')
+
+    def get_prev_link(self):
+        if not self.has_previous:
+            return None
+
+        cursor = self.encode_cursor(self._get_position(self.page[0]), True)
+        return self.get_cursor_link(cursor, 'prev')
+
+    def get_first_link(self):
+        if not self.has_previous:
+            return None
+
+        return self.get_cursor_link(None, 'first')
+
+    def get_last_link(self):
+        if not self.has_next:
+            return None
+
+        cursor = self.encode_cursor(None, True)
+        return self.get_cursor_link(cursor, 'last')
+
+    def get_cursor_link(self, cursor, rel):
+        replaced_uri = self.request.build_absolute_uri()
+        replaced_uri = remove_query_param(replaced_uri, self.page_query_param)
+        if cursor is None:
+            replaced_uri = remove_query_param(replaced_uri, self.cursor_query_param)
+        else:
+            replaced_uri = replace_query_param(replaced_uri, self.cursor_query_param, cursor)
+        replaced_uri = replace_query_param(replaced_uri, self.page_size_query_param, self.page_size)
+        return '<{}>; rel="{}"'.format(replaced_uri, rel)
+
+    def _get_position(self, item):
+        names = [f.lstrip('-') for f in self.ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+        return [getattr(item, name) for name in names]
+
+    def _compare(self, ordering, a, b):
+        for field, x, y in zip(ordering, self._get_position(a), self._get_position(b)):
+            if x != y:
+                return (-1 if x < y else 1) * (-1 if field.startswith('-') else 1)
+        return 0
+
+    def _reverse_field(self, field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+class SparseListModelMixin(mixins.ListModelMixin):
+    """
+    List a queryset with the fields selected by `fieldsets.SparseFieldset`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fieldset = fieldsets.SparseFieldset(request, self.get_serializer_class())
+        queryset = fieldset.trim_queryset(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(fieldset.serialize(page))
+
 # Using class-based views
 class TradePartnerList(views.APIView):
     queryset = TradePartner.objects.all()
+    pagination_class = CursorLinkHeaderPagination
 
+    @cache.cache_response('trade-partners')
     def get(self, request):
-        paginator = LinkHeaderPagination()
-        partners = paginator.paginate_queryset(self.queryset, request)
-        serializer = serializers.TradePartnerListSerializer(partners, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        fieldset = fieldsets.SparseFieldset(request, serializers.TradePartnerListSerializer)
+        paginator = self.pagination_class()
+        partners = paginator.paginate_queryset(fieldset.trim_queryset(self.queryset), request)
+        return paginator.get_paginated_response(fieldset.serialize(partners))
 
+    @cache.invalidates_cache('trade-partners')
     def post(self, request):
         serializer = serializers.TradePartnerSerializer(data=request.data)
         if serializer.is_valid():
@@ -122,11 +344,13 @@ class TradePartnerDetail(views.APIView):
         except TradePartner.DoesNotExist:
             raise Http404
 
+    @cache.cache_response('trade-partners')
     def get(self, request, pk):
         partner = self.get_object(pk)
         serializer = self.serializer_class(partner)
         return Response(serializer.data)
 
+    @cache.invalidates_cache('trade-partners')
     def put(self, request, pk):
         partner = self.get_object(pk)
         serializer = self.serializer_class(partner, data=request.data)
@@ -136,13 +360,15 @@ class TradePartnerDetail(views.APIView):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # Deleting a partner nulls Commodity.trade_partner as well
+    @cache.invalidates_cache('trade-partners', 'commodities')
     def delete(self, request, pk):
         partner = self.get_object(pk)
         partner.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 # Using generic class-based views
-class CommodityList(mixins.ListModelMixin,
+class CommodityList(SparseListModelMixin,
                     mixins.CreateModelMixin,
                     generics.GenericAPIView):
     queryset = Commodity.objects.all()
@@ -153,9 +379,11 @@ class CommodityList(mixins.ListModelMixin,
         else:
             return serializers.CommoditySerializer
 
+    @cache.cache_response('commodities')
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
+    @cache.invalidates_cache('commodities')
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
@@ -163,34 +391,147 @@ class CommodityDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Commodity.objects.all()
     serializer_class = serializers.CommoditySerializer
 
+    @cache.cache_response('commodities')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @cache.invalidates_cache('commodities')
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @cache.invalidates_cache('commodities')
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
 # Using ViewSets
-class InventoryViewSet(viewsets.ModelViewSet):
+class InventoryViewSet(SparseListModelMixin, viewsets.ModelViewSet):
     queryset = Inventory.objects.all()
     serializer_class = serializers.InventorySerializer
+    # group_by: (serializer, column the rows are grouped on)
+    summary_groups = {
+        'commodity': (serializers.InventorySummarySerializer, 'commodity'),
+        'trade_partner': (serializers.InventoryTradePartnerSummarySerializer, 'trade_partner'),
+        'type': (serializers.InventoryTypeSummarySerializer, 'type'),
+    }
+    history_fields = ['id', 'action', 'detail', 'type', 'quantity', 'created_at',
+                      'commodity', 'commodity_name', 'trade_partner']
+    export_chunk_size = 2000
+    export_fields = ['id', 'action', 'detail', 'type', 'quantity', 'created_at', 'inventory', 'user',
+                     'commodity', 'commodity_name', 'trade_partner']
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return Inventory.objects.select_related('commodity') \
+                .only('id', 'type', 'quantity', 'commodity__name')
+        elif self.action in ('retrieve', 'update', 'partial_update', 'adjust', 'destroy'):
+            return Inventory.objects.select_related('commodity')
+        elif self.action == 'history':
+            return InventoryHistory.objects.only(*self.history_fields)
+        elif self.action == 'movements':
+            return InventoryMovementRollup.objects.all()
+        else:
+            return super().get_queryset()
 
     def get_serializer_class(self):
         if self.action == 'list':
             return serializers.InventoryListSerializer
-        elif self.action == 'create':
+        elif self.action in ('create', 'bulk'):
             return serializers.InventoryCreateSerializer
         else:
             return self.serializer_class
 
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if self.action == 'history_export':
+            # The export renderers only lay out rows; errors are JSON.
+            renderer = renderers.FastJSONRenderer()
+            self.request.accepted_renderer = renderer
+            self.request.accepted_media_type = renderer.media_type
+        return response
+
     @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save()
         user = self.request.user
-
-        # TODO: replace custom signal with explicit function call
-        # https://docs.djangoproject.com/en/3.0/topics/signals/#defining-and-sending-signals
         signals.inventory_saved.send(sender=Inventory, instance=instance, user=user, created=True)
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, headers={'ETag': self.get_etag(instance)})
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data, headers={'ETag': self.get_etag(serializer.instance)})
+
     @transaction.atomic
     def perform_update(self, serializer):
-        instance = serializer.save()
+        original = copy.copy(serializer.instance)
+        self.check_if_match(original)
+
+        # Compare-and-swap on the version read by get_object(): a concurrent
+        # write in between makes this match no row instead of being lost.
+        swapped = Inventory.objects.filter(pk=original.pk, version=original.version) \
+            .update(version=F('version') + 1)
+        if not swapped:
+            raise PreconditionFailed() if self.has_if_match() else Conflict()
+
+        instance = serializer.save(version=original.version + 1)
         user = self.request.user
         signals.inventory_saved.send(sender=Inventory, instance=instance, user=user, created=False)
 
+    @action(detail=True, methods=['patch'])
+    def adjust(self, request, *args, **kwargs):
+        serializer = serializers.InventoryAdjustSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        instance = self.perform_adjust(self.get_object(), serializer.validated_data['delta'])
+        serializer = serializers.InventorySerializer(instance)
+        return Response(serializer.data, headers={'ETag': self.get_etag(instance)})
+
+    @transaction.atomic
+    def perform_adjust(self, instance, delta):
+        # The delta is applied by the database, so concurrent adjustments of
+        # the same inventory need no lock held across Python code. Only an
+        # If-Match request is pinned to the version it has seen.
+        self.check_if_match(instance)
+
+        queryset = Inventory.objects.filter(pk=instance.pk)
+        if self.has_if_match():
+            queryset = queryset.filter(version=instance.version)
+
+        if not queryset.adjust(delta):
+            current = Inventory.objects.filter(pk=instance.pk).values('version').first()
+            if current is None:
+                raise Http404
+            elif self.has_if_match() and current['version'] != instance.version:
+                raise PreconditionFailed()
+            raise Conflict('quantity cannot drop below zero')
+
+        instance = Inventory.objects.select_related('commodity').get(pk=instance.pk)
+        original = copy.copy(instance)
+        original.quantity -= delta
+
+        user = self.request.user
+        signals.record_stock_change(added=[instance], removed=[original])
+        signals.inventory_saved.send(sender=Inventory, instance=instance, user=user, created=False)
+        return instance
+
+    def has_if_match(self):
+        return 'HTTP_IF_MATCH' in self.request.META
+
+    def check_if_match(self, instance):
+        etags = parse_etags(self.request.META.get('HTTP_IF_MATCH', ''))
+        if etags and '*' not in etags and self.get_etag(instance) not in etags:
+            raise PreconditionFailed()
+
+    def get_etag(self, instance):
+        return quote_etag(str(instance.version))
+
     def perform_destroy(self, instance):
         pk=instance.id
         user = self.request.user
@@ -199,17 +540,177 @@ class InventoryViewSet(viewsets.ModelViewSet):
             instance.delete()
             signals.inventory_deleted.send(sender=Inventory, pk=pk, instance=instance, user=user)
 
+    @transaction.atomic
+    def perform_bulk_create(self, serializer):
+        instances = serializer.save()
+        user = self.request.user
+        signals.record_stock_change(added=instances)
+
+        logs = [signals.make_inventory_save_log(instance, user, True) for instance in instances]
+        audit.get_sink().emit(logs)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_bulk_create(serializer)
+
+        data = {
+            'results': serializer.data,
+            'errors': serializer.item_errors,
+        }
+
+        if not serializer.item_errors:
+            return Response(data, status=status.HTTP_201_CREATED)
+        elif serializer.instance:
+            return Response(data, status=status.HTTP_207_MULTI_STATUS)
+        else:
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'])
     def summary(self, request, *args, **kwargs):
-        queryset = Inventory.objects.summarize()
+        filters = serializers.InventorySummaryFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+
+        serializer_class, key = self.summary_groups[filters.validated_data['group_by']]
+        fieldset = fieldsets.SparseFieldset(request, serializer_class)
+        queryset = self.get_summary_queryset(filters.validated_data)
+        queryset = queryset.order_by(*self.get_summary_ordering(serializer_class, key, filters.validated_data))
 
         instance = self.paginate_queryset(queryset)
-        serializer = serializers.InventorySummarySerializer(instance, many=True)
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(fieldset.serialize(instance))
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], pagination_class=CursorLinkHeaderPagination)
     def history(self, request, *args, **kwargs):
-        queryset = InventoryHistory.objects.all()
+        filters = serializers.InventoryHistoryFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+
+        fieldset = fieldsets.SparseFieldset(request, serializers.InventoryHistorySerializer)
+        tiers = [
+            fieldset.trim_queryset(self.filter_history(queryset, filters.validated_data))
+            for queryset in self.get_history_tiers(self.get_queryset(), filters.validated_data)
+        ]
+        instance = self.paginate_queryset(tiers)
+        return self.get_paginated_response(fieldset.serialize(instance))
+
+    @action(detail=False, methods=['get'], url_path='history/export',
+            renderer_classes=[renderers.CSVRenderer, renderers.NDJSONRenderer])
+    def history_export(self, request, *args, **kwargs):
+        filters = serializers.InventoryHistoryFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+
+        tiers = [
+            self.iterate_export(self.filter_history(queryset, filters.validated_data).values_list(*self.export_fields))
+            for queryset in self.get_history_tiers(InventoryHistory.objects.all(), filters.validated_data)
+        ]
+        # Archived rows are all older than the hot ones.
+        if not filters.validated_data['ordering'].startswith('-'):
+            tiers.reverse()
+        queryset = itertools.chain(*tiers)
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(self.export_fields, queryset),
+            content_type='{}; charset={}'.format(renderer.media_type, renderer.charset))
+        response['Content-Disposition'] = 'attachment; filename="inventory-history.{}"'.format(renderer.format)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def movements(self, request, *args, **kwargs):
+        filters = serializers.InventoryMovementFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+
+        fieldset = fieldsets.SparseFieldset(request, serializers.InventoryMovementSerializer)
+        queryset = self.filter_movements(self.get_queryset(), filters.validated_data) \
+            .summarize(filters.validated_data['granularity'])
         instance = self.paginate_queryset(queryset)
-        serializer = serializers.InventoryHistorySerializer(instance, many=True)
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(fieldset.serialize(instance))
+
+    def filter_movements(self, queryset, filters):
+        # Rollups are kept per hour, so since and until select whole buckets.
+        if 'since' in filters:
+            queryset = queryset.filter(bucket__gte=filters['since'])
+        if 'until' in filters:
+            queryset = queryset.filter(bucket__lt=filters['until'])
+        if 'commodity' in filters:
+            queryset = queryset.filter(commodity=filters['commodity'])
+        if 'trade_partner' in filters:
+            queryset = queryset.filter(trade_partner=filters['trade_partner'])
+        return queryset
+
+    def iterate_export(self, queryset):
+        """
+        Rows of the ordered values_list() `queryset`, read by keyset in
+        chunks of `export_chunk_size`. Every chunk is a query of its own
+        rather than the next fetch from an open cursor, so the body can be
+        produced on any thread, as ReadPoolASGIHandler does.
+        """
+        ordering = queryset.query.order_by
+        columns = [self.export_fields.index(field.lstrip('-')) for field in ordering]
+
+        chunk = queryset
+        while True:
+            rows = list(chunk[:self.export_chunk_size])
+            yield from rows
+            if len(rows) < self.export_chunk_size:
+                return
+
+            position = [rows[-1][column] for column in columns]
+            chunk = queryset.filter(get_keyset_filter(ordering, position))
+
+    def get_summary_queryset(self, filters):
+        # The ledger already holds the per-commodity totals of all trade
+        # partners; anything else is aggregated from the inventories.
+        if filters['group_by'] == 'commodity' and 'trade_partner' not in filters:
+            return CommodityStockSummary.objects.summarize(min_total=filters.get('min_total'))
+
+        return Inventory.objects.summarize(
+            filters['group_by'], trade_partner=filters.get('trade_partner'), min_total=filters.get('min_total'))
+
+    def get_summary_ordering(self, serializer_class, key, filters):
+        if 'ordering' not in filters:
+            return [key]
+
+        ordering = filters['ordering']
+        name = ordering.lstrip('-')
+        fields = serializer_class().fields
+        if name not in fields:
+            raise exceptions.ValidationError({'ordering': ['Unknown field: {}'.format(name)]})
+
+        # The group key breaks ties, so that pages do not overlap.
+        prefix = '-' if ordering.startswith('-') else ''
+        source = fields[name].source
+        return [prefix + source] if source == key else [prefix + source, key]
+
+    def get_history_tiers(self, queryset, filters):
+        """
+        The hot history `queryset`, followed by the archive when the
+        requested range starts at or before the newest archived row.
+        """
+        tiers = [queryset]
+
+        archived_until = InventoryHistoryArchive.objects.last_created_at()
+        if archived_until is not None and filters.get('since', archived_until) <= archived_until:
+            tiers.append(InventoryHistoryArchive.objects.only(*self.history_fields))
+        return tiers
+
+    def filter_history(self, queryset, filters):
+        # Every filter combination is ordered by created_at so that the
+        # (created_at), (inventory, created_at) or (commodity, created_at)
+        # index drives the scan.
+        if 'inventory' in filters:
+            queryset = queryset.for_inventory(filters['inventory'])
+        if 'commodity' in filters:
+            queryset = queryset.for_commodity(filters['commodity'])
+        if 'since' in filters:
+            queryset = queryset.created_since(filters['since'])
+        if 'until' in filters:
+            queryset = queryset.created_until(filters['until'])
+        if 'action' in filters:
+            queryset = queryset.filter(action=filters['action'])
+        if 'user' in filters:
+            queryset = queryset.for_user(filters['user'])
+
+        ordering = filters.get('ordering', 'created_at')
+        tie_breaker = '-id' if ordering.startswith('-') else 'id'
+        return queryset.order_by(ordering, tie_breaker)
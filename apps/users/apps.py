@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = 'apps.users'
+
+    def ready(self):
+        from apps.users import signals
+        from apps.users.authentication import stats
+        from django_freight.instrumentation import REGISTRY
+
+        REGISTRY.register_collector(stats.collect)
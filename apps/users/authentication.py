@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication
+
+import threading
+
+
+class CacheStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset(self):
+        with self.lock:
+            self.hits = self.misses = 0
+
+    def collect(self):
+        return [
+            '# HELP freight_token_cache_lookups_total Token authentication cache lookups',
+            '# TYPE freight_token_cache_lookups_total counter',
+            'freight_token_cache_lookups_total{{result="hit"}} {}'.format(self.hits),
+            'freight_token_cache_lookups_total{{result="miss"}} {}'.format(self.misses),
+        ]
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')]
+
+def make_key(key):
+    return 'auth:token:{}'.format(key)
+
+def invalidate(*keys):
+    get_cache().delete_many([make_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps the token -> user lookup in the cache
+    named by TOKEN_CACHE_ALIAS for TOKEN_CACHE_TIMEOUT seconds.
+
+    Entries are dropped when the token is deleted or its user is saved or
+    deleted (see apps.users.signals). With a per-process backend such as
+    LocMemCache that only reaches the current process, so other workers can
+    keep a stale entry until it expires.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+
+        token = cache.get(make_key(key))
+        stats.record(token is not None)
+        if token is not None:
+            return (token.user, token)
+
+        user, token = super().authenticate_credentials(key)
+        cache.set(make_key(key), token, getattr(settings, 'TOKEN_CACHE_TIMEOUT', 60))
+        return (user, token)
@@ -0,0 +1,20 @@
+from django.db.models import signals
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from apps.users import authentication
+from apps.users.models import User
+
+
+@receiver(signals.post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    authentication.invalidate(instance.key)
+
+@receiver(signals.post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    authentication.invalidate(*keys)
@@ -1,3 +1,87 @@
 from django.test import TestCase
 
+from model_bakery import baker
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from apps.users import authentication
+
 # Create your tests here.
+class CachedTokenAuthenticationTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.user = baker.make_recipe('apps.users.user')
+
+    def setUp(self):
+        super().setUp()
+
+        authentication.get_cache().clear()
+        authentication.stats.reset()
+
+        self.token = Token.objects.create(user=self.user)
+        self.url = '/api/users/{}/'.format(self.user.pk)
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+
+    def test_token_lookup_is_cached(self):
+        # Given
+        self.client.get(self.url)
+
+        # When
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(authentication.stats.hits, 1)
+        self.assertEqual(authentication.stats.misses, 1)
+        self.assertEqual(authentication.stats.hit_rate, 0.5)
+
+    def test_deleted_token_is_rejected(self):
+        # Given
+        self.client.get(self.url)
+
+        # When
+        self.token.delete()
+        response = self.client.get(self.url)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        # Given
+        self.client.get(self.url)
+
+        # When
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_detail_update_refreshes_cached_user(self):
+        # Given
+        self.client.get(self.url)
+
+        # When
+        self.client.patch(self.url, data={'first_name': 'Lauren'})
+        response = self.client.get(self.url)
+
+        # Then
+        self.assertEqual(response.data['first_name'], 'Lauren')
+        self.assertEqual(authentication.stats.misses, 2)
+
+    def test_invalid_token_is_rejected(self):
+        # Given
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        # When
+        response = self.client.get(self.url)
+
+        # Then
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -9,8 +9,12 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_freight.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from django_freight.handlers import ReadPoolASGIHandler
+
+application = ReadPoolASGIHandler()
@@ -0,0 +1,44 @@
+"""
+Connection tuning for the DATABASES profile in settings.
+
+Three per-database keys, on top of Django's own, are handled here:
+
+* CONN_HEALTH_CHECKS - with persistent connections (CONN_MAX_AGE > 0),
+  test a reused connection at the start of each request and drop it if the
+  server has closed it, instead of failing the request's first query.
+* JOURNAL_MODE       - SQLite journal mode set on every new connection,
+  e.g. 'wal' so that readers do not block the writer.
+* SYNCHRONOUS        - SQLite synchronous level, e.g. 'normal', which in
+  WAL mode syncs at checkpoints rather than on every commit.
+"""
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+JOURNAL_MODES = frozenset(['delete', 'truncate', 'persist', 'memory', 'wal', 'off'])
+SYNCHRONOUS_LEVELS = frozenset(['off', 'normal', 'full', 'extra'])
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    journal_mode = (connection.settings_dict.get('JOURNAL_MODE') or '').lower()
+    synchronous = (connection.settings_dict.get('SYNCHRONOUS') or '').lower()
+    with connection.cursor() as cursor:
+        if journal_mode in JOURNAL_MODES:
+            cursor.execute('PRAGMA journal_mode = {}'.format(journal_mode))
+        if synchronous in SYNCHRONOUS_LEVELS:
+            cursor.execute('PRAGMA synchronous = {}'.format(synchronous))
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import contextvars
+import functools
+
+
+class ReadPoolASGIHandler(ASGIHandler):
+    """
+    ASGI handler that serves the read-only listing endpoints from a bounded
+    thread pool.
+
+    Django 3.0 runs every synchronous view on the single thread shared by
+    sync_to_async, so an ASGI deployment serves one request at a time.
+    Requests for `read_views` instead run through the regular middleware,
+    authentication, view and pagination stack on one of
+    `ASGI_READ_THREADS` worker threads; everything else keeps Django's
+    default path.
+
+    Streaming bodies are produced on the same pool, part by part, since
+    Django iterates them on the event loop, where a body that reads the
+    database raises SynchronousOnlyOperation.
+    """
+    read_methods = frozenset(['GET', 'HEAD', 'OPTIONS'])
+    read_views = frozenset([
+        'inventory-list',
+        'inventory-summary',
+        'inventory-history',
+        'inventory-history-export',
+        'inventory-movements',
+        'apps.commodities.views.CommodityList',
+        'apps.commodities.views.CommodityDetail',
+    ])
+
+    def __init__(self):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ASGI_READ_THREADS', 16),
+            thread_name_prefix='asgi-read')
+
+    async def get_response(self, request):
+        if not self.is_read_request(request):
+            return await sync_to_async(super().get_response)(request)
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(context.run, self.get_read_response, request))
+
+    def get_read_response(self, request):
+        # request_started/request_finished fire on other threads, so the
+        # worker manages its own connection lifetime.
+        close_old_connections()
+        try:
+            return BaseHandler.get_response(self, request)
+        finally:
+            close_old_connections()
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        # Headers as ASGIHandler.send_response() builds them.
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        loop = asyncio.get_running_loop()
+        parts = iter(response)
+        while True:
+            part = await loop.run_in_executor(self.executor, next, parts, None)
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        response.close()
+
+    def is_read_request(self, request):
+        if request.method not in self.read_methods:
+            return False
+
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.view_name in self.read_views
@@ -0,0 +1,202 @@
+"""
+Per-request SQL and timing instrumentation.
+
+InstrumentationMiddleware times a sample of requests and records for each
+endpoint:
+
+* db     - number of queries and time spent executing them
+* app    - view time minus db time, i.e. serializers and other Python work
+* render - time spent rendering the response
+* total  - wall time through the middleware
+
+Sampled responses carry the figures in a ``Server-Timing`` header, and every
+sample is folded into in-process histograms served by ``metrics_view`` in the
+Prometheus text format. Settings live in ``INSTRUMENTATION``::
+
+    INSTRUMENTATION = {
+        'SAMPLE_RATE': 0.1,       # fraction of requests to time
+        'SERVER_TIMING': True,    # add the Server-Timing header
+    }
+"""
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+import bisect
+import contextlib
+import random
+import threading
+import time
+
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+
+
+def get_config():
+    config = {'SAMPLE_RATE': 0.1, 'SERVER_TIMING': True}
+    config.update(getattr(settings, 'INSTRUMENTATION', {}))
+    return config
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+class Registry:
+    """
+    Histograms keyed by (metric, endpoint), shared by the threads of one
+    process; each worker process is scraped on its own.
+    """
+    metrics = {
+        'db_seconds': ('Time spent executing SQL per request', DURATION_BUCKETS),
+        'app_seconds': ('View time excluding SQL per request', DURATION_BUCKETS),
+        'render_seconds': ('Response rendering time per request', DURATION_BUCKETS),
+        'request_seconds': ('Total request time', DURATION_BUCKETS),
+        'queries': ('SQL queries per request', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.collectors = []
+
+    def register_collector(self, collector):
+        """
+        Add a callable returning extra lines of Prometheus text output.
+        """
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def observe(self, endpoint, values):
+        with self.lock:
+            for metric, value in values.items():
+                key = (metric, endpoint)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(self.metrics[metric][1])
+                self.histograms[key].observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms = {}
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric, (description, _) in self.metrics.items():
+                name = 'freight_{}'.format(metric)
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for (key, endpoint), histogram in sorted(self.histograms.items()):
+                    if key != metric:
+                        continue
+                    label = 'endpoint="{}"'.format(endpoint.replace('\\', '\\\\').replace('"', '\\"'))
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, bound, count))
+                    lines.append('{}_sum{{{}}} {}'.format(name, label, histogram.sum))
+                    lines.append('{}_count{{{}}} {}'.format(name, label, histogram.count))
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+
+class RequestTimings:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.queries = 0
+        self.db = 0.0
+        self.endpoint = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+class InstrumentationMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if random.random() >= config['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        timings = request._timings = RequestTimings()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+
+        values = self.get_values(timings, finished)
+        if timings.endpoint is not None:
+            REGISTRY.observe(timings.endpoint, values)
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = self.get_server_timing(timings, values)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, '_timings', None)
+        if timings is None:
+            return None
+
+        match = request.resolver_match
+        timings.endpoint = '{} {}'.format(request.method, match.view_name or match.route)
+        timings.view_started = time.perf_counter()
+        return None
+
+    def process_template_response(self, request, response):
+        # Called once the view has returned and before the response is
+        # rendered, which is how view and render time are told apart.
+        timings = getattr(request, '_timings', None)
+        if timings is not None:
+            timings.view_finished = time.perf_counter()
+        return response
+
+    def get_values(self, timings, finished):
+        values = {
+            'db_seconds': timings.db,
+            'request_seconds': finished - timings.started,
+            'queries': timings.queries,
+        }
+        if timings.view_started is not None:
+            view_finished = timings.view_finished or finished
+            values['app_seconds'] = max(view_finished - timings.view_started - timings.db, 0)
+            values['render_seconds'] = finished - view_finished if timings.view_finished else 0
+        return values
+
+    def get_server_timing(self, timings, values):
+        metrics = ['db;desc="{} queries";dur={:.2f}'.format(timings.queries, values['db_seconds'] * 1000)]
+        if 'app_seconds' in values:
+            metrics.append('app;dur={:.2f}'.format(values['app_seconds'] * 1000))
+            metrics.append('render;dur={:.2f}'.format(values['render_seconds'] * 1000))
+        metrics.append('total;dur={:.2f}'.format(values['request_seconds'] * 1000))
+        return ', '.join(metrics)
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
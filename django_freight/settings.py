@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'django_freight.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +77,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'django_freight.wsgi.application'
 
+# Worker threads serving the read-only listing endpoints under ASGI; see
+# django_freight/handlers.py
+ASGI_READ_THREADS = 16
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -83,14 +88,80 @@ INTERNAL_IPS = [
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
+# Picked from the environment: DB_ENGINE=postgresql with DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST and DB_PORT for production, SQLite otherwise.
+# Connections are kept for DB_CONN_MAX_AGE seconds and health checked
+# before reuse (see django_freight.database). DB_POOLER=pgbouncer suits
+# PgBouncer in transaction pooling mode, which cannot keep the server-side
+# cursors that QuerySet.iterator() opens.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'django_freight'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOLER') == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # WAL lets readers run alongside the single writer, and writers
+            # wait up to `timeout` seconds for the lock instead of failing.
+            # A crash cannot corrupt the database in WAL mode with
+            # synchronous=normal; a power loss may drop the last commits.
+            'JOURNAL_MODE': 'wal',
+            'SYNCHRONOUS': 'normal',
+            'OPTIONS': {
+                'timeout': 20,
+            },
+        }
+    }
 
-DATABASES = {
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Swap the backend (e.g. django_redis.cache.RedisCache) to share cached
+# responses between processes.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
 }
 
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+TOKEN_CACHE_ALIAS = 'tokens'
+TOKEN_CACHE_TIMEOUT = 60
+
+# Paginated counts are cached in the response cache; on PostgreSQL, lists
+# the planner estimates at the threshold or above report the estimate.
+PAGINATION_COUNT_CACHE_TIMEOUT = 10
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 1000000
+
 # Custom User model
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-user-model
 
@@ -165,6 +236,14 @@ LOGGING = {
     },
 }
 
+# Request instrumentation
+# Fraction of requests that get Server-Timing headers and feed the /metrics/
+# histograms; see django_freight/instrumentation.py
+INSTRUMENTATION = {
+    'SAMPLE_RATE': 0.1,
+    'SERVER_TIMING': True,
+}
+
 # django-extensions
 # https://django-extensions.readthedocs.io/en/latest/index.html
 SHELL_PLUS_PRINT_SQL = True
@@ -173,11 +252,32 @@ SHELL_PLUS_PRINT_SQL = True
 # https://www.django-rest-framework.org/api-guide/settings/
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    # orjson-backed when it is installed, stdlib json otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'apps.commodities.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'apps.commodities.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'apps.commodities.pagination.CachedCountLimitOffsetPagination',
     'PAGE_SIZE': 30
 }
+
+# Inventory audit log
+# SyncAuditSink writes history rows inside the request transaction;
+# BufferedAuditSink queues them in memory on commit and writes them in
+# batches, losing whatever is queued if the process dies, e.g.
+# {'SINK': 'apps.commodities.audit.BufferedAuditSink',
+#  'OPTIONS': {'flush_size': 100, 'flush_interval': 1.0}}
+INVENTORY_AUDIT = {
+    'SINK': 'apps.commodities.audit.SyncAuditSink',
+    'OPTIONS': {},
+}
@@ -18,9 +18,12 @@ from django.urls import path, include
 
 import debug_toolbar
 
+from django_freight.instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('apps.users.urls')),
     path('api/', include('apps.commodities.urls')),
     path('__debug__/', include(debug_toolbar.urls)),
+    path('metrics/', metrics_view),
 ]